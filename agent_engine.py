@@ -0,0 +1,291 @@
+# agent_engine.py
+"""Single agent engine and registry shared by backend/app.py and new.py.
+
+Each role is an AgentSpec built from the dict returned by its
+create_*_agent() function (or from a JSON config file), and every spec
+talks to the model through the lazily-created shared clients, so importing
+this module costs no client construction.
+
+Every call starts with the agent's stable prompt prefix (system prompt, role,
+goals) as the system message. The prefix is rendered once per spec (see
+prefix_for) and is byte-identical across turns and processes, so
+provider-side prompt caching can reuse it; only the user turn after it
+varies. Memories are not in the prefix: the user turn starts with the
+MEMORY_TOP_K long-term and same-run memories most relevant to the prompt,
+and every reply is remembered (see agent_memory.py). With MEMORY_TOP_K=0
+the whole long-term list is in the prefix instead (timestamps left out).
+
+Pass structured=True to ask for a JSON reply shaped by the agent's schema
+(see structured_output.py): the format instruction goes into the user turn,
+so the cached prefix is unchanged, and JSON mode is requested when available.
+
+Pass turn="kickoff" / "relay" / "synthesis" to let the model router pick the
+model for that kind of turn (see model_backends.py); the spec's own model is
+the fallback.
+
+New roles can be added without a
+new module:
+  - call register_agent({...}) with an agent dict, or
+  - point AGENT_CONFIG at a JSON file holding a list of agent dicts.
+"""
+import os
+import json
+import time
+import importlib
+
+from metrics import record_call
+from structured_output import SCHEMAS, format_instruction, json_response_format, json_mode_rejected
+from model_backends import DEFAULT_MODEL, TURN_TYPES, get_router, resolve
+from agent_memory import MEMORY_TOP_K, MEMORY_WRITE_TURNS, SHORT_TERM, amemory_context, aremember, \
+    memory_context, remember
+
+# built-in roles: agent id -> (module, factory function)
+BUILTIN_AGENTS = {
+    "CEO": ("ceo_hf_agent", "create_ceo_agent"),
+    "CTO": ("cto_hf_agent", "create_cto_agent"),
+    "Designer": ("designer_hf_agent", "create_designer_agent"),
+    "Marketer": ("marketer_hf_agent", "create_marketer_agent"),
+}
+
+
+class AgentSpec:
+    """Compact, immutable-by-convention description of one agent role."""
+
+    __slots__ = ("id", "role", "display_name", "system_prompt", "goals", "long_term", "model", "schema",
+                 "_prefix")
+
+    def __init__(self, id, role="", display_name=None, system_prompt="", goals=(),
+                 long_term=(), model=DEFAULT_MODEL, schema=None):
+        self.id = id
+        self.role = role
+        self.display_name = display_name or id
+        self.system_prompt = system_prompt
+        self.goals = tuple(goals)
+        self.long_term = tuple(long_term)
+        self.model = model
+        self.schema = dict(SCHEMAS.get(id, {}) if schema is None else schema)
+        self._prefix = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a spec from a create_*_agent() style dict."""
+        return cls(
+            id=data["id"],
+            role=data.get("role", ""),
+            display_name=data.get("display_name"),
+            system_prompt=data.get("system_prompt", ""),
+            goals=data.get("goals", ()),
+            long_term=data.get("memory", {}).get("long_term", ()),
+            model=data.get("model", DEFAULT_MODEL),
+            schema=data.get("schema"),
+        )
+
+    def render_prefix(self):
+        """Stable system prompt for this agent (see prefix_for for the cached copy)."""
+        lines = [self.system_prompt or f"You are the {self.id} agent."]
+        if self.role:
+            lines.append(f"Role: {self.role}")
+        if self.goals:
+            lines.append("Goals:")
+            lines.extend(f"- {goal}" for goal in self.goals)
+        if self.long_term and not MEMORY_TOP_K:
+            lines.append("Long-term memory:")
+            lines.extend(f"- {item.get('title', item) if isinstance(item, dict) else item}"
+                         for item in self.long_term)
+        return "\n".join(lines)
+
+    def messages(self, prompt, structured=False, run_id=None, memory=None):
+        if memory is None:
+            memory = memory_context(self.id, prompt, run_id=run_id, seeds=self.long_term) if MEMORY_TOP_K else ""
+        if memory:
+            prompt = f"{memory}\n\n{prompt}"
+        if structured:
+            prompt = f"{prompt}\n\n{format_instruction(self.schema)}"
+        return [{"role": "system", "content": prefix_for(self)},
+                {"role": "user", "content": prompt}]
+
+    def _request(self, prompt, structured, turn, run_id, memory=None):
+        return {"model": get_router().route(self.id, turn, self.model),
+                "messages": self.messages(prompt, structured, run_id, memory),
+                "response_format": json_response_format() if structured else None}
+
+    async def _arequest(self, prompt, structured, turn, run_id):
+        # memory recall embeds the prompt and reads SQLite: keep it off the event loop
+        memory = await amemory_context(self.id, prompt, run_id=run_id, seeds=self.long_term) if MEMORY_TOP_K else ""
+        return self._request(prompt, structured, turn, run_id, memory)
+
+    def _finish(self, model, seconds, stats, reply=None, run_id=None):
+        stats["model"] = model
+        record_call(self.id, model, seconds, stats)
+        if not (stats.get("error") or stats.get("cached") or stats.get("coalesced") or stats.get("cancelled")):
+            get_router().observe(model, seconds)
+        if reply and MEMORY_WRITE_TURNS:
+            remember(self.id, reply, SHORT_TERM, run_id)
+
+    async def _afinish(self, model, seconds, stats, reply=None, run_id=None):
+        self._finish(model, seconds, stats, None, run_id)
+        if reply and MEMORY_WRITE_TURNS:
+            await aremember(self.id, reply, SHORT_TERM, run_id)
+
+    # Each call is instrumented (see metrics.py); pass a `stats` dict to
+    # also receive the routed model, cache hit, token usage and error
+    # details for the call. A provider that rejects JSON mode is retried
+    # once without it. `run_id` scopes the short-term memory recalled for
+    # and written by the call.
+    def generate(self, prompt, stats=None, structured=False, turn=None, run_id=None):
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        request = self._request(prompt, structured, turn, run_id)
+        backend, model = resolve(request["model"])
+        reply = None
+        try:
+            try:
+                reply = backend.complete(model, request["messages"], stats, request["response_format"])
+            except Exception as e:
+                if request["response_format"] is None or not json_mode_rejected(e):
+                    raise
+                reply = backend.complete(model, request["messages"], stats)
+            return reply
+        except Exception as e:
+            stats["error"] = type(e).__name__
+            raise
+        finally:
+            self._finish(request["model"], time.perf_counter() - start, stats, reply, run_id)
+
+    async def agenerate(self, prompt, stats=None, structured=False, turn=None, run_id=None):
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        request = await self._arequest(prompt, structured, turn, run_id)
+        backend, model = resolve(request["model"])
+        reply = None
+        try:
+            try:
+                reply = await backend.acomplete(model, request["messages"], stats, request["response_format"])
+            except Exception as e:
+                if request["response_format"] is None or not json_mode_rejected(e):
+                    raise
+                reply = await backend.acomplete(model, request["messages"], stats)
+            return reply
+        except Exception as e:
+            stats["error"] = type(e).__name__
+            raise
+        finally:
+            await self._afinish(request["model"], time.perf_counter() - start, stats, reply, run_id)
+
+    # write_memory=False leaves the reply out of short-term memory (a
+    # speculative call remembers it only once it is used, see speculation.py)
+    async def astream(self, prompt, stats=None, structured=False, turn=None, run_id=None, write_memory=True):
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        request = await self._arequest(prompt, structured, turn, run_id)
+        backend, model = resolve(request["model"])
+        sent = False
+        parts = []
+        complete = False
+        try:
+            try:
+                async for token in backend.astream(model, request["messages"], stats,
+                                                   request["response_format"]):
+                    sent = True
+                    parts.append(token)
+                    yield token
+            except Exception as e:
+                if sent or request["response_format"] is None or not json_mode_rejected(e):
+                    raise
+                async for token in backend.astream(model, request["messages"], stats):
+                    parts.append(token)
+                    yield token
+            complete = True
+        except Exception as e:
+            stats["error"] = type(e).__name__
+            raise
+        finally:
+            reply = "".join(parts) if complete and write_memory else None
+            await self._afinish(request["model"], time.perf_counter() - start, stats, reply, run_id)
+
+    def __repr__(self):
+        return f"AgentSpec(id={self.id!r}, model={self.model!r})"
+
+
+_registry = {}
+_config_loaded = False
+
+
+def prefix_for(spec):
+    """Rendered prompt prefix for `spec`, computed once per spec. It is kept
+    on the spec, so per-run specs (e.g. a CEO for another niche, see
+    orchestrator.py) get their own prefix and a replaced spec drops its own."""
+    if spec._prefix is None:
+        spec._prefix = spec.render_prefix()
+    return spec._prefix
+
+
+def register_agent(data):
+    """Register (or replace) an agent from a dict or AgentSpec."""
+    spec = data if isinstance(data, AgentSpec) else AgentSpec.from_dict(data)
+    _registry[spec.id] = spec
+    return spec
+
+
+def _load_builtin(agent_id):
+    module_name, factory = BUILTIN_AGENTS[agent_id]
+    module = importlib.import_module(module_name)
+    if agent_id == "CEO":
+        return register_agent(getattr(module, factory)(module.STARTUP_NICHE))
+    return register_agent(getattr(module, factory)())
+
+
+def load_agent_config(path):
+    """Register every agent dict listed in a JSON config file."""
+    with open(path, "r") as f:
+        for data in json.load(f):
+            register_agent(data)
+
+
+def _load_configured():
+    global _config_loaded
+    if not _config_loaded:
+        _config_loaded = True
+        if os.getenv("AGENT_CONFIG"):
+            load_agent_config(os.getenv("AGENT_CONFIG"))
+
+
+def get_agent(agent_id):
+    """Return the spec for `agent_id`, building it on first use."""
+    spec = _registry.get(agent_id)
+    if spec is None:
+        if agent_id in BUILTIN_AGENTS:
+            return _load_builtin(agent_id)
+        _load_configured()
+        spec = _registry.get(agent_id)
+        if spec is None:
+            raise KeyError(f"Unknown agent: {agent_id}")
+    return spec
+
+
+def preload_agents():
+    """Build all built-in and configured specs (and their prompt prefixes)
+    up front; returns the registry."""
+    for agent_id in BUILTIN_AGENTS:
+        get_agent(agent_id)
+    _load_configured()
+    for spec in list(_registry.values()):
+        prefix_for(spec)
+    return dict(_registry)
+
+
+def validate_agents(specs=None):
+    """Problems that would fail calls with the registered specs (empty when
+    all are usable): a missing prompt, or a routed model without a backend."""
+    problems = []
+    router = get_router()
+    for agent_id, spec in (specs or _registry).items():
+        if not (spec.system_prompt or spec.role):
+            problems.append(f"{agent_id}: no system_prompt or role")
+        for turn in TURN_TYPES:
+            for model_spec in router.candidates(agent_id, turn, spec.model):
+                try:
+                    resolve(model_spec)
+                except Exception as e:
+                    problems.append(f"{agent_id}: model {model_spec!r}: {type(e).__name__}: {e}")
+    return sorted(set(problems))
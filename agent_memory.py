@@ -0,0 +1,378 @@
+# agent_memory.py
+"""Agent memory with vector retrieval.
+
+Agents used to get their whole long_term list in every prompt (and never
+used short_term). Here every agent has a memory store of embedded items,
+and each call only receives the MEMORY_TOP_K items most similar to its
+prompt, so the prompt stays the same size however much is remembered:
+  - long_term: durable facts (the agent dict's long_term items are seeds,
+    remember(kind="long_term") adds more)
+  - short_term: the agent's own past replies, scoped to a run ID; only
+    recalled within the same run (run None is the CLI scripts / new.py).
+    forget_run() drops a run's items when it ends; runs not searched or
+    written for MEMORY_SHORT_TERM_TTL seconds (e.g. ones another process
+    ran) are dropped from the in-process index too
+
+Embeddings are computed once, when an item is written. The default
+embedder hashes word unigrams and bigrams into MEMORY_DIM buckets (no
+model, works offline); MEMORY_EMBEDDER=<model spec> uses an embeddings
+model of an OpenAI-compatible backend instead (see model_backends.py).
+Vectors live in a NumPy matrix that grows geometrically, so writes are
+incremental and a query is one matrix-vector product; without NumPy a
+pure-Python index is used. NumPy is imported on the first write, not with
+this module (it is a noticeable part of a cold start).
+
+Items are written through to SQLite (MEMORY_PATH, WAL mode, shared by
+worker processes; default: in-process only). Each store picks up rows
+written by other processes before every search. Embedding (possibly an
+HTTP call) and SQLite block, so async callers use aremember() and
+amemory_context(), which run them in a thread.
+"""
+import os
+import re
+import json
+import asyncio
+import math
+import heapq
+import sqlite3
+import hashlib
+import threading
+import itertools
+import time
+import zlib
+from array import array
+from functools import lru_cache
+from operator import mul
+
+from context_manager import summarize_text
+
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_PATH = os.getenv("MEMORY_PATH")
+MEMORY_DIM = int(os.getenv("MEMORY_DIM", "256"))
+MEMORY_EMBEDDER = os.getenv("MEMORY_EMBEDDER", "hashing")
+MEMORY_WRITE_TURNS = os.getenv("MEMORY_WRITE_TURNS", "1") != "0"
+MEMORY_SHORT_TERM_TTL = float(os.getenv("MEMORY_SHORT_TERM_TTL", "3600"))
+
+LONG_TERM = "long_term"
+SHORT_TERM = "short_term"
+
+_WORD = re.compile(r"\w+")
+
+
+# --- Embedders ---
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams, L2-normalized."""
+
+    def __init__(self, dim=MEMORY_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, text):
+        words = _WORD.findall(text.lower())
+        vector = [0.0] * self.dim
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode())
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return array("f", (v / norm for v in vector))
+
+
+class ModelEmbedder:
+    """Embeddings model of an OpenAI-compatible backend, e.g. "text-embedding-3-small"."""
+
+    def __init__(self, model_spec):
+        self.model_spec = model_spec
+        self.name = model_spec
+
+    def embed(self, text):
+        from model_backends import resolve
+        from shared_client import get_client
+        backend, model = resolve(self.model_spec)
+        response = get_client(backend.base_url, backend.api_key_env).embeddings.create(model=model, input=[text])
+        vector = response.data[0].embedding
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return array("f", (v / norm for v in vector))
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = HashingEmbedder() if MEMORY_EMBEDDER == "hashing" else ModelEmbedder(MEMORY_EMBEDDER)
+    return _embedder
+
+
+@lru_cache(maxsize=4096)
+def embed(text):
+    """Embedding of `text` (cached: prompts and seed items repeat)."""
+    return get_embedder().embed(text)
+
+
+# --- Vector index ---
+_np = False  # not imported yet
+
+
+def numpy():
+    """The numpy module, or None when it is not installed (imported on first use)."""
+    global _np
+    if _np is False:
+        try:
+            import numpy as np
+        except ImportError:  # optional: fall back to a pure-Python index
+            np = None
+        _np = np
+    return _np
+
+
+class VectorIndex:
+    """Append-only matrix of unit vectors, each tagged with an integer group."""
+
+    def __init__(self):
+        self.size = 0
+        self._rows = None
+        self._groups = None
+
+    def add(self, vector, group=0):
+        np = numpy()
+        if np is None:
+            if self._rows is None:
+                self._rows, self._groups = [], []
+            self._rows.append(vector)
+            self._groups.append(group)
+        else:
+            if self._rows is None:
+                self._rows = np.zeros((64, len(vector)), dtype=np.float32)
+                self._groups = np.zeros(64, dtype=np.int32)
+            elif self.size == len(self._rows):  # grow geometrically: amortized O(1) appends
+                self._rows = np.concatenate([self._rows, np.zeros_like(self._rows)])
+                self._groups = np.concatenate([self._groups, np.zeros_like(self._groups)])
+            self._rows[self.size] = np.frombuffer(vector, dtype=np.float32)
+            self._groups[self.size] = group
+        self.size += 1
+
+    def drop(self, groups):
+        """Remove the rows of `groups`; returns the old positions of the rows kept, in order."""
+        wanted = set(groups)
+        kept = [i for i in range(self.size) if self._groups[i] not in wanted]
+        if len(kept) == self.size:
+            return kept
+        if not kept:
+            self._rows = self._groups = None
+        elif numpy() is None:
+            self._rows = [self._rows[i] for i in kept]
+            self._groups = [self._groups[i] for i in kept]
+        else:
+            self._rows = self._rows[kept]
+            self._groups = self._groups[kept]
+        self.size = len(kept)
+        return kept
+
+    def search(self, vector, k, groups=(0,)):
+        """Top-k [(score, position)] among rows whose group is in `groups`."""
+        if not self.size or k <= 0:
+            return []
+        np = numpy()
+        if np is None:
+            wanted = set(groups)
+            return heapq.nlargest(k, ((sum(map(mul, row, vector)), i) for i, row in enumerate(self._rows)
+                                      if self._groups[i] in wanted))
+        scores = self._rows[:self.size] @ np.frombuffer(vector, dtype=np.float32)
+        mask = np.isin(self._groups[:self.size], groups)
+        k = min(k, int(mask.sum()))
+        if k == 0:
+            return []
+        scores = np.where(mask, scores, -np.inf)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(float(scores[i]), int(i)) for i in top[np.argsort(-scores[top])]]
+
+
+# --- Stores ---
+_conn = None
+_conn_lock = threading.Lock()
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(MEMORY_PATH or ":memory:", check_same_thread=False, timeout=30)
+        if MEMORY_PATH:
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS memories ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, agent TEXT NOT NULL, "
+            "embedder TEXT NOT NULL, kind TEXT NOT NULL, run TEXT, text TEXT NOT NULL, "
+            "meta TEXT, vector BLOB NOT NULL)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS memories_agent ON memories (agent, embedder, seq)")
+        _conn.commit()
+    return _conn
+
+
+class MemoryStore:
+    """One agent's memories: SQLite rows plus an in-process VectorIndex over them."""
+
+    def __init__(self, agent_id):
+        self.agent_id = agent_id
+        self.items = []        # {"text", "kind", "run", "meta"}, by index position
+        self.index = VectorIndex()
+        self._last_seq = 0
+        self._groups = {}      # (kind, run) -> index group; long_term is 0
+        self._runs = {}        # run -> its groups
+        self._used = {}        # group -> last write or search
+        self._next_group = itertools.count(1)
+        self._swept = time.time()
+        self._lock = threading.Lock()
+
+    def _group(self, kind, run_id):
+        if kind == LONG_TERM:
+            return 0
+        group = self._groups.get((kind, run_id))
+        if group is None:
+            group = self._groups[(kind, run_id)] = next(self._next_group)
+            self._runs.setdefault(run_id, []).append(group)
+        self._used[group] = time.time()
+        return group
+
+    def _drop(self, groups):
+        """Remove `groups` from the index (caller holds the lock)."""
+        groups = set(groups)
+        if not groups:
+            return
+        self.items = [self.items[i] for i in self.index.drop(groups)]
+        for key, group in list(self._groups.items()):
+            if group in groups:
+                del self._groups[key]
+                self._used.pop(group, None)
+                run_groups = [g for g in self._runs[key[1]] if g != group]
+                if run_groups:
+                    self._runs[key[1]] = run_groups
+                else:
+                    del self._runs[key[1]]
+
+    def forget(self, run_id):
+        """Drop the short-term items of `run_id` from the index."""
+        with self._lock:
+            self._drop(self._runs.get(run_id, ()))
+
+    def _sweep(self):
+        """Drop groups idle for MEMORY_SHORT_TERM_TTL (caller holds the lock)."""
+        now = time.time()
+        if not MEMORY_SHORT_TERM_TTL or now - self._swept < min(60.0, MEMORY_SHORT_TERM_TTL):
+            return
+        self._swept = now
+        self._drop(group for run_id, groups in self._runs.items() if run_id is not None
+                   for group in groups if now - self._used[group] > MEMORY_SHORT_TERM_TTL)
+
+    def sync(self):
+        """Index rows written since the last sync (by this or another process)."""
+        with _conn_lock:
+            rows = _connection().execute(
+                "SELECT seq, kind, run, text, meta, vector FROM memories "
+                "WHERE agent = ? AND embedder = ? AND seq > ? ORDER BY seq",
+                (self.agent_id, get_embedder().name, self._last_seq)).fetchall()
+        for seq, kind, run_id, text, meta, vector in rows:
+            self.items.append({"text": text, "kind": kind, "run": run_id, "meta": json.loads(meta) if meta else None})
+            self.index.add(array("f", vector), self._group(kind, run_id))
+            self._last_seq = seq
+        self._sweep()
+
+    def add(self, text, kind=SHORT_TERM, run_id=None, meta=None):
+        """Embed and store one memory (identical items are stored once)."""
+        key = hashlib.sha1(json.dumps([self.agent_id, kind, run_id, text]).encode()).hexdigest()
+        vector = embed(text)
+        with _conn_lock:
+            conn = _connection()
+            conn.execute("INSERT OR IGNORE INTO memories (id, agent, embedder, kind, run, text, meta, vector) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, self.agent_id, get_embedder().name, kind, run_id, text,
+                          json.dumps(meta) if meta is not None else None, vector.tobytes()))
+            conn.commit()
+        with self._lock:
+            self.sync()
+
+    def search(self, query, k=MEMORY_TOP_K, run_id=None):
+        """Top-k [(score, item)] long-term memories and short-term ones of `run_id`."""
+        vector = embed(query)
+        with self._lock:
+            self.sync()
+            groups = [0] + self._runs.get(run_id, [])
+            for group in groups[1:]:
+                self._used[group] = time.time()
+            return [(score, self.items[i]) for score, i in self.index.search(vector, k, groups)]
+
+    def __len__(self):
+        return len(self.items)
+
+
+_stores = {}
+
+
+def get_memory(agent_id):
+    """Process-wide MemoryStore of `agent_id`."""
+    store = _stores.get(agent_id)
+    if store is None:
+        store = _stores.setdefault(agent_id, MemoryStore(agent_id))
+    return store
+
+
+def remember(agent_id, text, kind=SHORT_TERM, run_id=None, meta=None):
+    if text and text.strip():
+        get_memory(agent_id).add(text.strip(), kind, run_id, meta)
+
+
+def forget_run(run_id):
+    """Delete the short-term memories of a finished run (all agents)."""
+    if run_id is None:
+        return  # the CLI scripts' memory is kept across invocations
+    with _conn_lock:
+        conn = _connection()
+        conn.execute("DELETE FROM memories WHERE run = ? AND kind != ?", (run_id, LONG_TERM))
+        conn.commit()
+    for store in list(_stores.values()):
+        store.forget(run_id)
+
+
+async def aforget_run(run_id):
+    await asyncio.to_thread(forget_run, run_id)
+
+
+async def aremember(agent_id, text, kind=SHORT_TERM, run_id=None, meta=None):
+    """remember() for async callers (runs in a thread)."""
+    if text and text.strip():
+        await asyncio.to_thread(remember, agent_id, text, kind, run_id, meta)
+
+
+def item_text(item):
+    """Text of a long_term seed item ({"title": ...} dicts or strings)."""
+    return item.get("title", json.dumps(item)) if isinstance(item, dict) else str(item)
+
+
+def recall(agent_id, query, k=MEMORY_TOP_K, run_id=None, seeds=()):
+    """Texts of the k memories most relevant to `query`: the agent's stored
+    memories plus `seeds` (e.g. the agent dict's long_term items)."""
+    if k <= 0:
+        return []
+    vector = embed(query)
+    scored = [(sum(map(mul, embed(text), vector)), text) for text in map(item_text, seeds)]
+    scored.extend((score, item["text"]) for score, item in get_memory(agent_id).search(query, k, run_id))
+    texts = []
+    for _, text in sorted(scored, key=lambda pair: -pair[0]):
+        if text not in texts:
+            texts.append(text)
+    return texts[:k]
+
+
+def memory_context(agent_id, query, k=MEMORY_TOP_K, run_id=None, seeds=()):
+    """"Relevant memory" block for a prompt (empty when nothing is recalled);
+    items are summarized, so the block's size is bounded by k."""
+    texts = recall(agent_id, query, k, run_id, seeds)
+    if not texts:
+        return ""
+    return "Relevant memory:\n" + "\n".join(f"- {summarize_text(text)}" for text in texts)
+
+
+async def amemory_context(agent_id, query, k=MEMORY_TOP_K, run_id=None, seeds=()):
+    """memory_context() for async callers (runs in a thread)."""
+    return await asyncio.to_thread(memory_context, agent_id, query, k, run_id, seeds)
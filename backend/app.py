@@ -1,33 +1,162 @@
 # backend/app.py
+import time
+IMPORT_START = time.perf_counter()
+
 import os
 import sys
 import json
-from fastapi import FastAPI
+import uuid
+import asyncio
+import importlib.util
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from typing import Literal, Optional
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 
 # load .env in backend (if you create one)
 load_dotenv()
 
-# ensure parent dir (where your agent files live) is on path
+# ensure parent dir (where your agent files live) is importable, unless the
+# launcher already put it on the path (serve.py does, via PYTHONPATH)
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-if ROOT not in sys.path:
+if importlib.util.find_spec("agent_engine") is None:
     sys.path.append(ROOT)
+FRAMEWORK_SECONDS = time.perf_counter() - IMPORT_START
 
-# Import the wrapper functions from your agent files
-# These should be the wrapper functions you already have:
-# ceo_hf_agent.ceo_agent(...), cto_hf_agent.cto_agent(...), etc.
+# Agents come from the shared registry (see agent_engine.py). They all use
+# one lazily-created, pooled AsyncOpenAI client (see shared_client.py), so
+# a simulation never blocks a threadpool worker while waiting on the model.
 try:
-    from ceo_hf_agent import ceo_agent as ceo_fn
-    from cto_hf_agent import cto_agent as cto_fn
-    from designer_hf_agent import designer_agent as designer_fn
-    from marketer_hf_agent import marketer_agent as marketer_fn
+    from agent_engine import get_agent, preload_agents, validate_agents
+    from agent_memory import MEMORY_WRITE_TURNS, SHORT_TERM, aforget_run, aremember
+    from shared_client import close_async_client
+    from response_cache import get_cache
+    from job_queue import JobQueue, SQLiteJobStore
+    from context_manager import build_prompt
+    from metrics import record_turn, render_prometheus
+    from structured_output import JSONExtractor, validate
+    from model_backends import get_router, preload_backends
+    from orchestrator import AGENT_ORDER, agents_for, is_error, make_detector, make_turn, observe, \
+        run_params, turn_type
+    from sessions import SESSIONS_PRUNE_INTERVAL, Session, prune_sessions
+    from workflow import load_workflow, unroll
+    from history_index import HistoryIndex, PAGE_SIZE, encode_compact
+    from speculation import SPECULATE, Speculator
 except Exception as e:
     raise ImportError(f"Could not import agent wrappers: {e}")
 
 app = FastAPI(title="Agentic-startup API")
 
+# Where a worker's startup time goes; served by /readyz. The app modules
+# only import what a request needs up front: the openai/httpx chain, NumPy
+# and the agent modules are loaded by the warm-up (or on first use).
+startup_state = {"status": "starting", "error": None, "profile": {
+    "import_framework_seconds": round(FRAMEWORK_SECONDS, 3),
+    "import_app_seconds": round(time.perf_counter() - IMPORT_START - FRAMEWORK_SECONDS, 3),
+}}
+
+# Background simulation jobs: JOB_CONCURRENCY bounds the worker pool and
+# JOB_STORE_PATH (optional) persists the queue in SQLite across restarts.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH")
+
+# Runs are checkpointed after every turn as sessions keyed by run ID (the
+# job ID for jobs), so a restarted job or POST /sessions/{id}/resume picks
+# up from the last completed turn (see sessions.py). CHECKPOINT_RUNS=0 disables.
+# Session files are written in threads, and old sessions are pruned every
+# SESSIONS_PRUNE_INTERVAL seconds.
+CHECKPOINT_RUNS = os.getenv("CHECKPOINT_RUNS", "1") != "0"
+
+async def run_job(job):
+    session = await asyncio.to_thread(Session.open, job.params, job.id) if CHECKPOINT_RUNS else None
+    done, _ = await run_params(job.params, job.conversation, session=session)
+    return done
+
+jobs = JobQueue(run_job, concurrency=JOB_CONCURRENCY,
+                store=SQLiteJobStore(JOB_STORE_PATH) if JOB_STORE_PATH else None)
+
+# Build and validate agent specs, the response cache and the pooled clients
+# when a worker starts rather than on its first request (PRELOAD=0 to
+# disable). The warm-up runs in a thread after startup, so the worker takes
+# traffic at once; /readyz reports 503 until it is done (or if it failed).
+PRELOAD = os.getenv("PRELOAD", "1") != "0"
+
+def check_agents():
+    problems = validate_agents()
+    if problems:
+        raise ValueError("Invalid agent specs: " + "; ".join(problems))
+
+def preload():
+    """Run the warm-up steps, timing each into startup_state["profile"]."""
+    profile = startup_state["profile"]
+    for name, step in (("agents", preload_agents), ("validate", check_agents), ("cache", get_cache),
+                       ("clients", preload_backends)):
+        start = time.perf_counter()
+        step()
+        profile[f"preload_{name}_seconds"] = round(time.perf_counter() - start, 3)
+
+async def prefetch_kickoff():
+    """Warm the response cache with the CEO kickoff for the default prompt
+    (the same request every default run starts with)."""
+    run_id = uuid.uuid4().hex
+    try:
+        await get_agent("CEO").agenerate(f"CEO: {SimRequest().prompt}", turn=turn_type("CEO", 0),
+                                         run_id=run_id)
+        await aforget_run(run_id)
+    except Exception as e:
+        print(f"⚠️ Kickoff prefetch failed: {e}")
+
+async def warm_up():
+    try:
+        if PRELOAD:
+            await asyncio.to_thread(preload)
+    except Exception as e:
+        startup_state.update(status="failed", error=f"{type(e).__name__}: {e}")
+        print(f"❌ Warm-up failed: {e}")
+        return
+    startup_state["status"] = "ready"
+    profile = startup_state["profile"]
+    profile["ready_seconds"] = round(time.perf_counter() - IMPORT_START, 3)
+    print(f"✅ Ready in {profile['ready_seconds']}s: {json.dumps(profile)}")
+    if SPECULATE:
+        await prefetch_kickoff()
+
+async def prune_sessions_periodically():
+    while True:
+        try:
+            pruned = await asyncio.to_thread(prune_sessions, keep=set(_resuming))
+            if pruned:
+                print(f"🧹 Pruned {pruned} old session(s)")
+        except OSError as e:
+            print(f"⚠️ Session pruning failed: {e}")
+        await asyncio.sleep(SESSIONS_PRUNE_INTERVAL)
+
+warm_up_task = None
+prune_task = None
+
+@app.on_event("startup")
+async def startup():
+    global warm_up_task, prune_task
+    warm_up_task = asyncio.ensure_future(warm_up())
+    if CHECKPOINT_RUNS:
+        prune_task = asyncio.ensure_future(prune_sessions_periodically())
+    await jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if prune_task is not None:
+        prune_task.cancel()
+    await jobs.stop()
+    await close_async_client()
+    cache = get_cache()
+    if cache is not None and hasattr(cache.backend, "flush"):
+        cache.backend.flush()  # pending access times
+
 # allow local dev from React
 app.add_middleware(
     CORSMiddleware,
@@ -36,63 +165,321 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# large conversation bodies are mostly repeated text; compress them on the wire
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 class SimRequest(BaseModel):
     prompt: str = "We need to build an AI-powered personal finance assistant."
     max_rounds: int = 3
+    # "round_robin" (CEO -> CTO -> Designer -> Marketer), "fanout"
+    # (CEO broadcasts to CTO/Designer/Marketer concurrently, then synthesizes)
+    # or "dag" (turns run as soon as their inputs are done, see workflow.py)
+    mode: Literal["round_robin", "fanout", "dag"] = "round_robin"
+    # "dag" mode: [{"agent", "inputs", "timeout"}, ...] per round (default: WORKFLOW_PATH / DEFAULT_WORKFLOW)
+    workflow: Optional[list] = None
+    # ask agents for schema-shaped JSON replies (see structured_output.py);
+    # each turn then also carries the parsed reply as "data"
+    structured: bool = False
+    # per-run budgets (0 = the RUN_TOKEN_BUDGET / RUN_TIME_BUDGET defaults);
+    # runs also stop once turns stop adding new content (see convergence.py)
+    token_budget: int = 0
+    time_budget: float = 0
+    # >0: return only the first page of the conversation plus a cursor for
+    # GET /sessions/{run_id}/history
+    page_size: int = 0
+    # optional startup niche for the CEO's system prompt (default: STARTUP_NICHE)
+    niche: Optional[str] = None
+    # /simulate/stream: start the next agent's call while the current reply
+    # streams (see speculation.py); None = the SPECULATE setting
+    speculate: Optional[bool] = None
+
+def sim_params(req):
+    """Run parameters as stored with jobs and sessions."""
+    if req.mode == "dag":
+        try:
+            unroll(load_workflow(req.workflow), 1)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid workflow: {e}")
+    return {"prompt": req.prompt, "max_rounds": max(1, int(req.max_rounds)), "mode": req.mode,
+            "structured": req.structured, "token_budget": req.token_budget,
+            "time_budget": req.time_budget, "niche": req.niche, "workflow": req.workflow}
 
 @app.post("/simulate")
-def simulate(req: SimRequest):
+async def simulate(req: SimRequest):
     """
-    Run a round-robin simulation:
-      CEO -> CTO -> Designer -> Marketer -> CEO -> ...
-    Returns the conversation as a list of messages.
+    Run a round-robin simulation and return the conversation as a list of messages.
     """
-    initial = req.prompt
-    max_rounds = max(1, int(req.max_rounds))
+    conversation = []
+    timings = []
+    params = sim_params(req)
+    session = await asyncio.to_thread(Session.create, params) if CHECKPOINT_RUNS else None
+    done, reason = await run_params(params, conversation, timings, session)
+    result = {"run_id": session.run_id if session else None, "conversation": conversation,
+              "done": done, "stop_reason": reason, "timings": timings}
+    if req.page_size > 0 and session is not None:
+        page, next_cursor = HistoryIndex(conversation).page(0, req.page_size)
+        result.update(conversation=page, next_cursor=next_cursor, total=len(conversation))
+    return result
+
+class JobRequest(SimRequest):
+    priority: int = 0
+
+# submit and cancel touch the queue's asyncio objects, so they run on the
+# event loop (async def) rather than in the threadpool
+@app.post("/jobs")
+async def submit_job(req: JobRequest):
+    """Queue a simulation and return its job ID immediately."""
+    job = await jobs.submit(sim_params(req), priority=req.priority)
+    return job.summary()
+
+def get_job_or_404(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job_or_404(job_id).summary()
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str, offset: int = 0, limit: Optional[int] = None):
+    """Conversation so far (from `offset`, at most `limit` turns); complete once status is done."""
+    if offset < 0:
+        raise HTTPException(status_code=422, detail=f"offset must be >= 0 (got {offset})")
+    job = get_job_or_404(job_id)
+    end = len(job.conversation) if limit is None else offset + max(1, limit)
+    return {**job.summary(), "offset": offset, "conversation": job.conversation[offset:end],
+            "next_offset": end if end < len(job.conversation) else None}
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    await asyncio.to_thread(get_job_or_404, job_id)
+    return (await jobs.cancel(job_id)).summary()
+
+# runs being resumed by this process
+_resuming = set()
+
+def get_session_or_404(run_id, cached=False):
+    session = Session.cached(run_id) if cached else Session.load(run_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run: {run_id}")
+    return session
 
-    agent_order = ["CEO", "CTO", "Designer", "Marketer"]
-    agent_fns = {"CEO": ceo_fn, "CTO": cto_fn, "Designer": designer_fn, "Marketer": marketer_fn}
+@app.get("/sessions/{run_id}")
+def session_status(run_id: str):
+    """Checkpoint summary and completed turns of a run."""
+    session = get_session_or_404(run_id, cached=True)
+    return {**session.summary(), "conversation": session.conversation()}
 
+@app.get("/sessions/{run_id}/history")
+def session_history(run_id: str, cursor: int = 0, limit: int = PAGE_SIZE, agent: Optional[str] = None,
+                    compact: bool = False):
+    """
+    Cursor-paginated checkpointed turns of a run, optionally only those
+    written by `agent`. Pass the returned next_cursor to get the next page
+    (null at the end). compact=true sends {"fields", "rows"} instead of
+    one object per turn.
+    """
+    history = get_session_or_404(run_id, cached=True).history()
+    entries, next_cursor = history.page(max(0, cursor), limit, sender=agent)
+    turns = [{"round": e["round"], "agent": e["agent"], **e["turn"]} for e in entries]
+    return {"run_id": run_id, "total": len(history), "cursor": cursor, "next_cursor": next_cursor,
+            "turns": encode_compact(turns) if compact else turns}
+
+class ResumeRequest(BaseModel):
+    # optionally continue for more rounds than the run was started with
+    max_rounds: Optional[int] = None
+
+@app.post("/sessions/{run_id}/resume")
+async def resume_session(run_id: str, req: Optional[ResumeRequest] = None):
+    """
+    Continue a run from its last completed turn: checkpointed turns are
+    replayed without model calls, the rest run live. Returns the full
+    conversation like /simulate.
+    """
+    session = await asyncio.to_thread(get_session_or_404, run_id)
+    job = await asyncio.to_thread(jobs.get, run_id)
+    if run_id in _resuming or job is not None and job.status == "running":
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is already running")
+    max_rounds = req.max_rounds if req is not None else None
     conversation = []
+    timings = []
+    _resuming.add(run_id)
+    try:
+        params = await asyncio.to_thread(session.resume_params,
+                                         max_rounds=max(1, int(max_rounds)) if max_rounds else None)
+        done, reason = await run_params(params, conversation, timings, session)
+    finally:
+        _resuming.discard(run_id)
+    return {"run_id": run_id, "conversation": conversation, "done": done, "stop_reason": reason,
+            "replayed": len(conversation) - len(timings), "timings": timings}
+
+@app.delete("/sessions/{run_id}")
+def delete_session(run_id: str):
+    get_session_or_404(run_id).delete()
+    return {"run_id": run_id, "deleted": True}
 
-    # Kickoff: CEO receives the initial prompt
+@app.get("/healthz")
+def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once the warm-up finished, 503 while it runs or if it
+    failed (e.g. invalid agent specs). Includes the startup profile."""
+    return JSONResponse(startup_state, status_code=200 if startup_state["status"] == "ready" else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of agent call and turn metrics."""
+    return render_prometheus()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss metrics of the shared agent response cache."""
+    cache = get_cache()
+    return cache.stats() if cache is not None else {"backend": "off"}
+
+@app.get("/models")
+def model_routes():
+    """Model routing config and observed per-model latency (see model_backends.py)."""
+    return get_router().stats()
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_turn(agent, sender, recipient, prompt, structured=False, detector=None, turn=None,
+                      spec=None, run_id=None, speculation=None, on_text=None, round_idx=0):
+    """
+    Stream one call to `agent` as SSE frames: turn_start, token*, turn_end.
+    The full reply is stored in holder["response"] (and the turn_end entry
+    in holder["turn"]) for the next hop.
+    With `structured`, tokens are fed to an incremental JSON extractor and a
+    "structured" event carries the validated object as soon as it closes.
+    A claimed `speculation` supplies the tokens of a call started earlier
+    (its reply is remembered here, once used); on_text(parts, size) is
+    called after every token (see speculation.py).
+    The turn is recorded in metrics like call_agent's turns.
+    """
+    start = time.perf_counter()
+    holder = {"response": ""}
+    yield sse_event("turn_start", {"from": sender, "to": recipient}), holder
+    spec = spec or get_agent(agent)
+    extractor = JSONExtractor() if structured else None
+    data = None
+    parts = []
+    size = 0
+    stats = speculation.stats if speculation is not None else {}
     try:
-        response = agent_fns["CEO"](f"CEO: {initial}")
+        tokens = speculation.tokens() if speculation is not None else \
+            spec.astream(prompt, stats=stats, structured=structured, turn=turn, run_id=run_id)
+        async for token in tokens:
+            parts.append(token)
+            size += len(token)
+            yield sse_event("token", {"from": sender, "to": recipient, "text": token}), holder
+            if on_text is not None:
+                on_text(parts, size)
+            if extractor is not None and data is None and extractor.feed(token) is not None:
+                data = validate(extractor.result, spec.schema)[0]
+                yield sse_event("structured", {"from": sender, "to": recipient, "data": data}), holder
+        holder["response"] = "".join(parts)
+        if speculation is not None and MEMORY_WRITE_TURNS:
+            await aremember(agent, holder["response"], SHORT_TERM, run_id)
     except Exception as e:
-        response = f"ERROR calling CEO agent: {e}"
-
-    conversation.append({"from": "CEO", "to": ["CTO","Designer","Marketer"], "response": response})
-
-    # Run rounds
-    for round_idx in range(max_rounds):
-        for i, speaker in enumerate(agent_order):
-            next_agent = agent_order[(i + 1) % len(agent_order)]
-
-            # turn response into something to send
-            if isinstance(response, dict):
-                # prefer standard keys if present, else JSON dump
-                msg = response.get("decision") or response.get("messages") or response
-                try:
-                    # convert to compact JSON string
-                    msg = json.dumps(response)
-                except Exception:
-                    msg = str(response)
-            else:
-                msg = str(response)
-
-            # call next agent
-            try:
-                response = agent_fns[next_agent](f"{speaker}: {msg}")
-            except Exception as e:
-                response = f"ERROR calling {next_agent} agent: {e}"
-
-            conversation.append({"from": speaker, "to": next_agent, "response": response})
-
-            # stop early if an agent explicitly signals done
-            if isinstance(response, dict) and response.get("status","").upper() == "DONE":
-                return {"conversation": conversation, "done": True}
-            if isinstance(response, str) and "DONE" in response.upper():
-                return {"conversation": conversation, "done": True}
-
-    return {"conversation": conversation, "done": False}
+        holder["response"] = f"ERROR calling {agent} agent: {e}"
+    record_turn(agent, round_idx, time.perf_counter() - start)
+    if detector is not None:
+        detector.add_tokens(stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0))
+    end = holder["turn"] = make_turn(sender, recipient, agent, holder["response"], structured and data is None)
+    if data is not None:
+        end["data"] = data
+    yield sse_event("turn_end", end), holder
+
+@app.post("/simulate/stream")
+async def simulate_stream(req: SimRequest):
+    """
+    Streaming variant of /simulate (Server-Sent Events).
+    Emits turn_start / token / turn_end per agent turn and a final done event
+    (with the stop reason); turns are sent as they are produced rather than
+    buffered into one body. Only round-robin runs stream: other modes get a
+    422 (use /simulate or /jobs for them).
+    """
+    if req.mode != "round_robin" or req.workflow is not None:
+        raise HTTPException(status_code=422,
+                            detail=f"/simulate/stream only runs mode 'round_robin' without a workflow "
+                                   f"(got mode {req.mode!r}); use /simulate or /jobs")
+    initial = req.prompt
+    max_rounds = max(1, int(req.max_rounds))
+    detector = make_detector(req.dict())
+    agents = agents_for(req.dict()) or {}
+    run_id = uuid.uuid4().hex  # scopes the agents' short-term memory to this stream
+
+    speculator = Speculator() if (SPECULATE if req.speculate is None else req.speculate) else None
+    # turns after the kickoff: (agent, sender, round)
+    schedule = [(AGENT_ORDER[(i + 1) % len(AGENT_ORDER)], speaker, round_idx + 1)
+                for round_idx in range(max_rounds) for i, speaker in enumerate(AGENT_ORDER)]
+    history = []
+
+    def speculate(agent, position):
+        """on_text hook for `agent`'s turn that may start turn `position` of the schedule early."""
+        if speculator is None or position >= len(schedule):
+            return None
+        follower, _, round_idx = schedule[position]
+        spec = agents.get(follower) or get_agent(follower)
+
+        def stream(prompt, stats):
+            return spec.astream(prompt, stats=stats, structured=req.structured,
+                                turn=turn_type(follower, round_idx), run_id=run_id, write_memory=False)
+        return speculator.watch(history, agent, follower, stream)
+
+    def done(stopped, reason):
+        result = {"done": stopped, "stop_reason": reason}
+        if speculator is not None:
+            speculator.discard()
+            result["speculation"] = speculator.stats()
+        return sse_event("done", result)
+
+    async def events():
+        try:
+            # Kickoff: CEO receives the initial prompt
+            holder = None
+            async for frame, holder in stream_turn("CEO", "CEO", ["CTO","Designer","Marketer"],
+                                                   f"CEO: {initial}", req.structured, detector, "kickoff",
+                                                   agents.get("CEO"), run_id, on_text=speculate("CEO", 0)):
+                yield frame
+            history.append({"from": "CEO", "response": holder["response"]})
+            if observe(detector, holder["turn"]):
+                yield done(True, detector.reason)
+                return
+
+            for position, (next_agent, speaker, round_idx) in enumerate(schedule):
+                if speculator is not None:
+                    prompt = speculator.prompt(history, next_agent)
+                    speculation = speculator.claim(next_agent, prompt)
+                else:
+                    prompt = build_prompt(history, next_agent)
+                    speculation = None
+                async for frame, holder in stream_turn(next_agent, speaker, next_agent, prompt, req.structured,
+                                                       detector, turn_type(next_agent, round_idx),
+                                                       agents.get(next_agent), run_id, speculation,
+                                                       speculate(next_agent, position + 1), round_idx):
+                    yield frame
+                response = holder["response"]
+                if not is_error(response):
+                    history.append({"from": next_agent, "response": response})
+
+                if observe(detector, holder["turn"]):
+                    yield done(True, detector.reason)
+                    return
+
+            yield done(False, "max_rounds")
+        finally:
+            if speculator is not None:
+                speculator.discard()
+            await aforget_run(run_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,81 @@
+# backend/serve.py
+"""Run the API with several uvicorn worker processes.
+
+    python backend/serve.py --workers 4 --port 8000
+
+Worker processes share nothing in memory, so unless already configured the
+multi-worker mode points them all at shared on-disk stores under DATA_DIR
+(default: the repo root):
+  RESPONSE_CACHE=sqlite, RESPONSE_CACHE_PATH=$DATA_DIR/response_cache.db
+  JOB_STORE_PATH=$DATA_DIR/jobs.db, SESSIONS_DIR=$DATA_DIR/sessions,
+  MEMORY_PATH=$DATA_DIR/memory.db
+The cache, job store and memory are SQLite databases in WAL mode with a busy timeout, safe for
+concurrent processes. Jobs are namespaced by their run (job) ID and claimed
+atomically, so each runs on exactly one worker while any worker can answer
+status, result and cancel requests (see job_queue.py). Every worker warms
+up agents, cache and clients in the background after startup (see PRELOAD
+in app.py); /healthz answers at once and /readyz once the warm-up is done.
+
+/metrics and /cache/stats report the worker that answered the request.
+
+    python backend/serve.py --profile-imports
+
+prints the modules that take longest to import with the app (python -X
+importtime), to keep cold starts fast.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BACKEND_DIR)
+
+
+def configure_shared_stores(data_dir):
+    """Default the cache, job store, sessions and memory to shared files in `data_dir`."""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ.setdefault("RESPONSE_CACHE", "sqlite")
+    os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(data_dir, "response_cache.db"))
+    os.environ.setdefault("JOB_STORE_PATH", os.path.join(data_dir, "jobs.db"))
+    os.environ.setdefault("SESSIONS_DIR", os.path.join(data_dir, "sessions"))
+    os.environ.setdefault("MEMORY_PATH", os.path.join(data_dir, "memory.db"))
+
+
+def import_profile(top=15):
+    """[(cumulative seconds, module)] of the slowest imports of the app."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, module = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():  # skip the header row
+                rows.append((int(cumulative) / 1e6, module.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Agentic-startup API with multiple workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", ROOT))
+    parser.add_argument("--profile-imports", action="store_true", help="print the slowest app imports and exit")
+    args = parser.parse_args()
+
+    if args.profile_imports:
+        print("⏱️ Slowest imports (cumulative seconds):")
+        for seconds, module in import_profile():
+            print(f"{seconds:8.3f}  {module}")
+        sys.exit(0)
+
+    # workers import the agent modules from the repo root
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")]))
+
+    import uvicorn
+    if args.workers > 1:
+        configure_shared_stores(os.path.abspath(args.data_dir))
+    print(f"✅ Starting {args.workers} worker(s) on http://{args.host}:{args.port}")
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers, app_dir=BACKEND_DIR)
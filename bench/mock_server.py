@@ -0,0 +1,162 @@
+# bench/mock_server.py
+"""Deterministic local stand-in for the OpenAI-compatible chat endpoint.
+
+Serves POST /v1/chat/completions (plain and stream=True) with replies and
+latencies derived from a hash of the request plus a seed, so identical runs
+produce identical traffic. Useful for benchmarks and offline development:
+
+    python bench/mock_server.py --port 8001 --latency lognormal:0.4,0.3 \
+        --token-rate 80 --fail-rate 0.02
+    MODEL_BASE_URL=http://127.0.0.1:8001/v1 YOUR_API_KEY_HERE=x uvicorn app:app
+
+Latency specs: "fixed:S", "uniform:LO,HI", "lognormal:MEDIAN,SIGMA" (seconds).
+Failures are returned as 500 or 429 (with Retry-After) at --fail-rate.
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ("plan", "users", "launch", "budget", "design", "growth", "api", "mobile",
+         "privacy", "insights", "roadmap", "pricing", "onboarding", "retention")
+
+
+def parse_latency(spec):
+    """Turn a latency spec string into a function rng -> seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng: values[0] * math.exp(rng.gauss(0, values[1]))
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class MockConfig:
+    def __init__(self, latency="fixed:0.05", token_rate=0.0, reply_tokens=60,
+                 fail_rate=0.0, seed=0):
+        self.latency = parse_latency(latency)
+        self.token_rate = token_rate  # tokens/second, 0 = instant
+        self.reply_tokens = reply_tokens
+        self.fail_rate = fail_rate
+        self.seed = seed
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=()):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data):
+            frame = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            request = json.loads(raw or b"{}")
+            with config.lock:
+                config.requests += 1
+                request_number = config.requests
+            digest = hashlib.sha256(raw).digest()
+            rng = random.Random(int.from_bytes(digest[:8], "big") ^ config.seed)
+            # failures depend on arrival order, so a retried request can succeed
+            fail_rng = random.Random(config.seed * 1_000_003 + request_number)
+
+            time.sleep(max(0.0, config.latency(rng)))
+            if fail_rng.random() < config.fail_rate:
+                if fail_rng.random() < 0.5:
+                    self._send_json(429, {"error": {"message": "rate limited"}}, [("Retry-After", "1")])
+                else:
+                    self._send_json(500, {"error": {"message": "injected failure"}})
+                return
+
+            tokens = [rng.choice(WORDS) for _ in range(config.reply_tokens)]
+            prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                     "total_tokens": prompt_tokens + len(tokens)}
+            model = request.get("model", "mock")
+
+            if not request.get("stream"):
+                if config.token_rate:
+                    time.sleep(len(tokens) / config.token_rate)
+                self._send_json(200, {
+                    "id": "mock-" + digest.hex()[:12], "object": "chat.completion",
+                    "created": 0, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": " ".join(tokens)}}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                if config.token_rate:
+                    time.sleep(1 / config.token_rate)
+                self._write_chunk(json.dumps({
+                    "id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token + (" " if i < len(tokens) - 1 else "")},
+                                 "finish_reason": None}],
+                }))
+            self._write_chunk(json.dumps({"id": "mock", "object": "chat.completion.chunk", "created": 0,
+                                          "model": model, "choices": [], "usage": usage}))
+            self._write_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread; returns the server."""
+    config = config or MockConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", default="fixed:0.05", help="fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="streamed tokens per second (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return MockConfig(args.latency, args.token_rate, args.reply_tokens, args.fail_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock model server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config_from_args(args)))
+    print(f"✅ Mock model server on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
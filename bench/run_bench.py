@@ -0,0 +1,204 @@
+# bench/run_bench.py
+"""Offline benchmark for the orchestrator and agents.
+
+Starts the deterministic mock model server (bench/mock_server.py) in-process,
+points the agents at it and drives the chosen targets at a given concurrency:
+  simulate  - POST /simulate on backend/app.py (in-process ASGI, no network)
+  new       - new.py::run_interaction
+  ask       - the per-agent ask_* functions (CEO -> CTO -> Designer -> Marketer)
+Reports p50/p95/p99 latency, requests/sec, errors and peak memory, and can
+save a baseline JSON and diff a later run against it:
+
+    python bench/run_bench.py --targets simulate,new --iterations 50 --concurrency 10 \
+        --latency lognormal:0.2,0.3 --save-baseline bench/baseline.json
+    python bench/run_bench.py --targets simulate --compare bench/baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, ROOT, os.path.join(ROOT, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import mock_server  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, wall, errors):
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+
+
+def run_threaded(fn, iterations, concurrency):
+    """Run fn(i) `iterations` times on a thread pool; returns (latencies, wall, errors)."""
+    latencies, errors = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(one, i) for i in range(iterations)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return latencies, time.perf_counter() - start, errors
+
+
+def bench_simulate(args):
+    import httpx
+    from app import app
+    from shared_client import close_async_client
+
+    async def main():
+        latencies, errors = [], 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(i):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/simulate", json={
+                        "prompt": f"{args.prompt} (run {i})", "max_rounds": args.rounds, "mode": args.mode})
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.iterations)))
+            wall = time.perf_counter() - start
+        # the pooled client is bound to this event loop
+        await close_async_client()
+        return latencies, wall, errors
+
+    return asyncio.run(main())
+
+
+def bench_new(args):
+    import new
+
+    def one(i):
+        new.run_interaction(max_rounds=args.rounds)
+
+    return run_threaded(one, args.iterations, args.concurrency)
+
+
+def bench_ask(args):
+    import ceo_hf_agent, cto_hf_agent, designer_hf_agent, marketer_hf_agent
+
+    def one(i):
+        state = ceo_hf_agent.initialize_state(ceo_hf_agent.create_ceo_agent(ceo_hf_agent.STARTUP_NICHE))
+        state["agents"]["CTO"] = cto_hf_agent.create_cto_agent()
+        state["agents"]["Designer"] = designer_hf_agent.create_designer_agent()
+        state["agents"]["Marketer"] = marketer_hf_agent.create_marketer_agent()
+        ceo_hf_agent.ask_ceo_first_action(state)
+        cto_hf_agent.ask_cto_for_plan(state)
+        designer_hf_agent.ask_designer_for_mockups(state)
+        marketer_hf_agent.ask_marketer_for_plan(state)
+
+    return run_threaded(one, args.iterations, args.concurrency)
+
+
+TARGETS = {"simulate": bench_simulate, "new": bench_new, "ask": bench_ask}
+
+
+def compare(results, baseline):
+    print("\n=== Comparison with baseline ===")
+    for target, current in results["targets"].items():
+        base = baseline.get("targets", {}).get(target)
+        if base is None:
+            print(f"{target}: no baseline")
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            old, new_value = base[key], current[key]
+            change = (new_value - old) / old * 100 if old else 0.0
+            print(f"{target:>9} {key:>7}: {old:>9} -> {new_value:>9} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent orchestrator against a local mock model")
+    parser.add_argument("--targets", default="simulate", help="comma-separated: " + ",".join(TARGETS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured iterations per target (imports, pools)")
+    parser.add_argument("--mode", default="round_robin", help="/simulate mode (round_robin or fanout)")
+    parser.add_argument("--prompt", default="We need to build an AI-powered personal finance assistant.")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--save-baseline", help="write results JSON to this path")
+    parser.add_argument("--compare", help="diff results against a saved baseline JSON")
+    mock_server.add_arguments(parser)
+    args = parser.parse_args()
+    for name in ("save_baseline", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    server = mock_server.start_server(mock_server.config_from_args(args))
+    # must be set before the agent modules (and shared_client) are imported
+    os.environ["MODEL_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("YOUR_API_KEY_HERE", "bench")
+    if not args.cache:
+        os.environ["RESPONSE_CACHE"] = "off"
+    # keep sim_state.json, sessions and friends out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="agentic-bench-"))
+    os.environ["SESSIONS_DIR"] = os.path.join(os.getcwd(), "sessions")
+
+    results = {"config": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare")},
+               "targets": {}}
+    for target in args.targets.split(","):
+        # the agents print every reply; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            if args.warmup:
+                TARGETS[target](argparse.Namespace(**{**vars(args), "iterations": args.warmup}))
+            tracemalloc.start()
+            latencies, wall, errors = TARGETS[target](args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        summary = summarize(latencies, wall, errors)
+        summary["peak_mem_mb"] = round(peak / 1e6, 2)
+        results["targets"][target] = summary
+        print(f"{target:>9}: {json.dumps(summary)}")
+    results["mock_requests"] = server.config.requests
+    server.shutdown()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,16 @@
 # ceo_hf_agent.py (GitHub Models version)
-from openai import OpenAI
 import json
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-STATE_FILE = "sim_state.json"
+from agent_engine import get_agent
+from state_store import StateStore
+from sessions import state_path
+from structured_output import parse_reply
+from model_backends import complete_json, get_router
+from agent_memory import memory_context, remember
+STATE_FILE = state_path()  # per-run file when SIM_RUN_ID is set (see sessions.py)
+store = StateStore(STATE_FILE)
 STARTUP_NICHE = "AI-powered personal finance assistant"
 
-# Setup OpenAI client (GitHub Models)
-client = OpenAI(
-    api_key=os.getenv("YOUR_API_KEY_HERE"),
-    base_url="https://models.inference.ai.azure.com"
-)
 
 # --- Step 1: Create CEO agent ---
 def create_ceo_agent(niche: str):
@@ -57,8 +56,7 @@ def initialize_state(ceo_agent):
         "chat_history": [],
         "meta": {"created_at": datetime.now().isoformat(), "niche": STARTUP_NICHE}
     }
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+    store.save(state)
     return state
 
 # --- Step 3: Ask CEO for first action ---
@@ -66,7 +64,7 @@ def ask_ceo_first_action(state):
     ceo = state["agents"]["CEO"]
     prompt = (
         f"{ceo['system_prompt']}\n"
-        f"Long-term memory: {json.dumps(ceo['memory']['long_term'], indent=2)}\n"
+        f"{memory_context('CEO', 'first action as CEO', seeds=ceo['memory']['long_term']) or 'Relevant memory: none'}\n"
         "Question: What is your first action as CEO? "
         "Respond ONLY in valid JSON format with the following structure:\n"
         "{\n"
@@ -76,32 +74,26 @@ def ask_ceo_first_action(state):
         "}"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",   # <-- replace with another GitHub model if you want
+    raw_output = complete_json(
+        get_router().route("CEO", "ask"),  # model per MODEL_ROUTES / MODEL_BACKEND (see model_backends.py)
         messages=[
             {"role": "system", "content": ceo["system_prompt"]},
             {"role": "user", "content": prompt}
         ]
     )
 
-    raw_output = response.choices[0].message.content
-
-    # Try to parse JSON
-    try:
-        json_start = raw_output.index("{")
-        json_end = raw_output.rindex("}") + 1
-        json_str = raw_output[json_start:json_end]
-        json_data = json.loads(json_str)
-
+    # Parse JSON (fenced or surrounded by prose); falls back to the raw text
+    remember("CEO", raw_output)  # short-term memory, recalled by later prompts
+    json_data, ok = parse_reply("CEO", raw_output)
+    if ok:
         print("\n--- CEO's First Action (JSON) ---")
         print(json.dumps(json_data, indent=2))
-    except (ValueError, json.JSONDecodeError):
+    else:
         print("\n⚠️ Could not parse JSON, raw output:")
         print(raw_output.strip())
-        json_data = {"messages": [], "artifacts": [], "decision": raw_output.strip()}
 
-    # Save to state
-    state["chat_history"].append({
+    # Save to state (appended to the journal, not a full rewrite)
+    store.append_message(state, {
         "from": "CEO",
         "to": ["CTO", "Designer", "Marketer"],
         "timestamp": datetime.now().isoformat(),
@@ -109,17 +101,10 @@ def ask_ceo_first_action(state):
         "subject": "First action",
         "body": json_data
     })
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
 
 # --- Step 4: Shared function for other agents ---
 def generate_response(prompt: str):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are the CEO agent."},
-                  {"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
+    return get_agent("CEO").generate(prompt)
 
 # --- Step 5: Main execution ---
 if __name__ == "__main__":
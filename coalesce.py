@@ -0,0 +1,95 @@
+# coalesce.py
+"""Single-flight coalescing of identical in-flight model calls.
+
+When many simulations issue the same request at the same time (e.g. the
+CEO kickoff for the default prompt), only the first caller - the leader -
+goes upstream; everyone else waits for and shares its result. Keys are the
+response-cache request hash, so "identical" means same model, messages and
+temperature. Completed results are then served by the response cache.
+
+Two flavours: SingleFlight for coroutines on the backend event loop and
+ThreadSingleFlight for the threaded CLI path (new.py).
+"""
+import asyncio
+import threading
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        """Await fn() once per key; returns (result, shared) where shared is
+        True when the result came from another caller's in-flight call."""
+        future = self._inflight.get(key)
+        while future is not None:
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this caller was cancelled
+                # the leader was cancelled: retry, possibly as the new leader
+                future = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # avoid "exception was never retrieved" when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except BaseException as e:
+            if isinstance(e, Exception):
+                future.set_exception(e)
+            else:
+                future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(key, None)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ThreadSingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Thread-safe counterpart of SingleFlight.do."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+inflight = SingleFlight()
+thread_inflight = ThreadSingleFlight()
@@ -0,0 +1,141 @@
+# context_manager.py
+"""Token-budgeted conversation context for agent prompts.
+
+Agents used to receive the previous turn (or the latest chat_history entry)
+re-serialized with indent=2, so prompts grew with every round. This module
+builds each agent's view of the history under a fixed token budget:
+  - messages are rendered as compact JSON / single-line text
+  - only senders relevant to the agent are included (the latest message
+    always is)
+  - the newest turns are kept verbatim, older ones are replaced by short
+    rolling summaries that are computed once per message and cached
+Works with both chat_history entries ({"from", "body", ...}) and backend
+turns ({"from", "response"}). Relevant messages are looked up through a
+per-sender index (see history_index.py) instead of scanning the history.
+"""
+import os
+import re
+import json
+from functools import lru_cache
+
+from history_index import index_for
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "2"))
+SUMMARY_CHARS = 240
+
+# whose messages each agent needs to see (None = everyone)
+RELEVANT_SENDERS = {
+    "CEO": None,
+    "CTO": ["CEO"],
+    "Designer": ["CEO", "CTO"],
+    "Marketer": ["CEO"],
+}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def compact_json(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def message_text(message):
+    """Single-string body of a chat_history entry or backend turn."""
+    body = message.get("body", message.get("response", ""))
+    if isinstance(body, str):
+        return body
+    try:
+        return compact_json(body)
+    except (TypeError, ValueError):
+        return str(body)
+
+
+@lru_cache(maxsize=4096)
+def summarize_text(text, max_chars=SUMMARY_CHARS):
+    """Extractive summary: leading sentences up to max_chars (cached per text)."""
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    return (cut[:end + 1] if end > max_chars // 3 else cut.rstrip()) + " …"
+
+
+def truncate_to_tokens(text, tokens):
+    max_chars = max(0, tokens * 4)
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " …"
+
+
+class ContextManager:
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, recent_turns=CONTEXT_RECENT_TURNS,
+                 relevant_senders=None):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.relevant_senders = relevant_senders or RELEVANT_SENDERS
+
+    def relevant(self, history, agent, end=None):
+        """Messages (before position `end`) from the senders `agent` needs."""
+        return index_for(history).select(senders=self.relevant_senders.get(agent), end=end)
+
+    def build(self, history, agent, token_budget=None, end=None):
+        """
+        Render the messages `agent` should see, newest last, within budget.
+        Returns "" when there is nothing relevant.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        lines = []
+        for age, message in enumerate(reversed(self.relevant(history, agent, end))):
+            text = message_text(message)
+            if age >= self.recent_turns:
+                text = summarize_text(text)
+            line = f"{message.get('from', '?')}: {text}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                if age < self.recent_turns and budget > 16:
+                    lines.append(truncate_to_tokens(line, budget))
+                break
+            lines.append(line)
+            budget -= cost
+        return "\n".join(reversed(lines))
+
+    def latest_tokens(self, latest=1, cap=None):
+        """Token share of each of the `latest` messages quoted by build_prompt
+        (longer ones are cut); `cap` lowers it."""
+        share = self.token_budget // max(1, latest)
+        return min(share, cap) if cap else share
+
+    def build_prompt(self, history, agent, latest=1, cap=None):
+        """
+        Prompt for `agent` in the orchestrator: the `latest` newest messages
+        verbatim (budget permitting, at most `cap` tokens each) preceded by
+        summarized relevant earlier turns.
+        """
+        share = self.latest_tokens(latest, cap)
+        latest_lines = [truncate_to_tokens(f"{m.get('from', '?')}: {message_text(m)}", share)
+                        for m in history[-latest:]]
+        latest_text = "\n\n".join(latest_lines)
+        remaining = self.token_budget - estimate_tokens(latest_text)
+        end = max(0, len(history) - latest)
+        earlier = self.build(history, agent, token_budget=remaining, end=end) if remaining > 0 else ""
+        if not earlier:
+            return latest_text
+        return f"Earlier conversation:\n{earlier}\n\n{latest_text}"
+
+
+_default = ContextManager()
+
+
+def build_context(history, agent, token_budget=None):
+    """Budgeted, relevance-filtered history for `agent` using the default manager."""
+    return _default.build(history, agent, token_budget=token_budget)
+
+
+def build_prompt(history, agent, latest=1, cap=None):
+    return _default.build_prompt(history, agent, latest=latest, cap=cap)
+
+
+def latest_tokens(latest=1, cap=None):
+    return _default.latest_tokens(latest, cap)
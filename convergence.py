@@ -0,0 +1,111 @@
+# convergence.py
+"""Early termination for simulations (backend/app.py and new.py).
+
+Runs used to stop only when "DONE" appeared anywhere in a reply - which
+also matches "abandoned" - or after max_rounds. ConvergenceDetector ends a
+run as soon as one of these holds:
+  - done:        an explicit status signal: {"status": "DONE"} in a
+                 structured reply, or a standalone DONE / "status: done"
+                 in free text (case-sensitive word, not a substring)
+  - stalled:     CONVERGENCE_STALL_TURNS consecutive turns that add almost
+                 nothing new; novelty is the share of a reply's word
+                 4-gram shingles not seen earlier in the run
+  - token_budget / time_budget: the run used RUN_TOKEN_BUDGET tokens or
+                 RUN_TIME_BUDGET seconds (0 = unlimited)
+"""
+import os
+import re
+import time
+import zlib
+import threading
+
+from structured_output import extract_json
+
+CONVERGENCE_MIN_NOVELTY = float(os.getenv("CONVERGENCE_MIN_NOVELTY", "0.15"))
+CONVERGENCE_STALL_TURNS = int(os.getenv("CONVERGENCE_STALL_TURNS", "3"))
+RUN_TOKEN_BUDGET = int(os.getenv("RUN_TOKEN_BUDGET", "0"))
+RUN_TIME_BUDGET = float(os.getenv("RUN_TIME_BUDGET", "0"))
+SHINGLE_WORDS = 4
+
+DONE_STATUSES = {"DONE", "COMPLETE", "COMPLETED", "FINISHED"}
+_DONE_WORD = re.compile(r"\bDONE\b")
+_STATUS_LINE = re.compile(r"\bstatus\W{0,3}\s*(done|complete|completed|finished)\b", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+
+def is_done(response, data=None):
+    """True when a reply explicitly signals that the simulation is finished."""
+    if isinstance(response, dict) and data is None:
+        data = response
+    if data is None and isinstance(response, str) and "{" in response:
+        data = extract_json(response)
+    if isinstance(data, dict) and "status" in data:
+        return str(data["status"]).strip().upper() in DONE_STATUSES
+    if isinstance(response, str):
+        return bool(_DONE_WORD.search(response) or _STATUS_LINE.search(response))
+    return False
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Hashed word n-grams of `text` (one shingle for very short texts)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+class ConvergenceDetector:
+    """Feed every turn to observe(); a non-None return is the stop reason."""
+
+    def __init__(self, token_budget=RUN_TOKEN_BUDGET, time_budget=RUN_TIME_BUDGET,
+                 min_novelty=CONVERGENCE_MIN_NOVELTY, stall_turns=CONVERGENCE_STALL_TURNS):
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.min_novelty = min_novelty
+        self.stall_turns = stall_turns
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.stalled = 0
+        self.reason = None
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def add_tokens(self, count):
+        with self._lock:
+            self.tokens += count
+
+    def novelty(self, text):
+        """Share of `text`'s shingles not seen before in this run (records them)."""
+        current = shingles(text)
+        if not current:
+            return 0.0
+        with self._lock:
+            new = len(current - self._seen)
+            self._seen |= current
+        return new / len(current)
+
+    def over_budget(self):
+        if self.token_budget and self.tokens >= self.token_budget:
+            return "token_budget"
+        if self.time_budget and time.monotonic() - self.started >= self.time_budget:
+            return "time_budget"
+        return None
+
+    def observe(self, response, data=None, error=False):
+        """Record one turn; returns (and keeps) the stop reason, or None."""
+        if self.reason is not None:
+            return self.reason
+        if not error:
+            if is_done(response, data):
+                self.reason = "done"
+                return self.reason
+            text = response if isinstance(response, str) else str(data or response)
+            if self.stall_turns and self.novelty(text) < self.min_novelty:
+                self.stalled += 1
+                if self.stalled >= self.stall_turns:
+                    self.reason = "stalled"
+                    return self.reason
+            else:
+                self.stalled = 0
+        self.reason = self.over_budget()
+        return self.reason
@@ -1,15 +1,16 @@
 # cto_hf_agent.py (GitHub Models version)
-from openai import OpenAI
 import json
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-STATE_FILE = "sim_state.json"
+from agent_engine import get_agent
+from state_store import StateStore
+from sessions import state_path
+from context_manager import build_context
+from structured_output import parse_reply
+from model_backends import complete_json, get_router
+from agent_memory import memory_context, remember
+STATE_FILE = state_path()  # per-run file when SIM_RUN_ID is set (see sessions.py)
+store = StateStore(STATE_FILE)
 
-client = OpenAI(
-    api_key=os.getenv("YOUR_API_KEY_HERE"),
-    base_url="https://models.inference.ai.azure.com"
-)
 
 def create_cto_agent():
     return {
@@ -37,81 +38,63 @@ def create_cto_agent():
     }
 
 def update_state_with_cto(cto_agent):
-    if not os.path.exists(STATE_FILE):
-        raise FileNotFoundError(f"{STATE_FILE} not found. Run CEO agent first.")
-    
-    with open(STATE_FILE, "r") as f:
-        state = json.load(f)
-    
-    state["agents"]["CTO"] = cto_agent
-    
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-    
+    def add_cto(state):
+        state.setdefault("agents", {})["CTO"] = cto_agent
+
+    # one locked read-modify-write; raises FileNotFoundError if the CEO agent has not run
+    state = store.update(add_cto)
     print("✅ CTO agent added to simulation state.")
+    return state
 
 def ask_cto_for_plan(state):
     cto = state["agents"]["CTO"]
-    ceo_messages = [m for m in state["chat_history"] if m["from"] == "CEO"]
     
+    context = build_context(state['chat_history'], 'CTO') or 'None'
     prompt = (
         f"{cto['system_prompt']}\n"
-        f"Long-term memory: {json.dumps(cto['memory']['long_term'], indent=2)}\n"
-        f"Recent CEO instructions: {json.dumps(ceo_messages[-1], indent=2) if ceo_messages else 'None'}\n"
+        f"{memory_context('CTO', context, seeds=cto['memory']['long_term']) or 'Relevant memory: none'}\n"
+        f"Recent CEO instructions: {context}\n"
         f"Question: What is your technical plan? Respond in JSON with keys: architecture, tools, timeline."
     )
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    raw_output = complete_json(
+        get_router().route("CTO", "ask"),  # model per MODEL_ROUTES / MODEL_BACKEND (see model_backends.py)
         messages=[
             {"role": "system", "content": cto["system_prompt"]},
             {"role": "user", "content": prompt}
         ]
     )
+    remember("CTO", raw_output)  # short-term memory, recalled by later prompts
+    json_data, ok = parse_reply("CTO", raw_output)
+    if not ok:
+        print("\n⚠️ Could not parse JSON, storing raw output.")
     
-    raw_output = response.choices[0].message.content
-    
-    state["chat_history"].append({
+    store.append_message(state, {
         "from": "CTO",
         "to": ["CEO", "Designer", "Marketer"],
         "timestamp": datetime.now().isoformat(),
         "type": "proposal",
         "subject": "Technical plan",
-        "body": raw_output
+        "body": json_data
     })
     
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-    
-    return raw_output
+    return json_data
 
 # --- Shared public function for new.py ---
 def generate_response(prompt: str):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are the CTO agent."},
-                  {"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
+    return get_agent("CTO").generate(prompt)
 
 
 if __name__ == "__main__":
-    # Load state
-    with open(STATE_FILE, "r") as f:
-        state = json.load(f)
-    
     # Always overwrite CTO agent with the correct structure
     cto_agent_struct = create_cto_agent()
-    state.setdefault("agents", {})["CTO"] = cto_agent_struct
-    
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+    state = update_state_with_cto(cto_agent_struct)
     
     # Ask CTO for plan
     print("💬 Asking CTO for technical plan...")
     answer = ask_cto_for_plan(state)
     print("\n--- CTO's Technical Plan ---")
-    print(answer)
+    print(json.dumps(answer, indent=2))
     print("✅ CTO agent created and technical plan requested.")
 
 
@@ -1,15 +1,16 @@
 # designer_hf_agent.py (GitHub Models version)
-from openai import OpenAI
 import json
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-STATE_FILE = "sim_state.json"
+from agent_engine import get_agent
+from state_store import StateStore
+from sessions import state_path
+from context_manager import build_context
+from structured_output import parse_reply
+from model_backends import complete_json, get_router
+from agent_memory import memory_context, remember
+STATE_FILE = state_path()  # per-run file when SIM_RUN_ID is set (see sessions.py)
+store = StateStore(STATE_FILE)
 
-client = OpenAI(
-    api_key=os.getenv("YOUR_API_KEY_HERE"),
-    base_url="https://models.inference.ai.azure.com"
-)
 def create_designer_agent():
     """Create the Designer agent structure."""
     return {
@@ -40,79 +41,61 @@ def create_designer_agent():
 
 def update_state_with_designer(designer_agent):
     """Add Designer agent to the simulation state."""
-    if not os.path.exists(STATE_FILE):
-        raise FileNotFoundError(f"{STATE_FILE} not found. Run CEO agent first.")
-    
-    with open(STATE_FILE, "r") as f:
-        state = json.load(f)
-    
-    state["agents"]["Designer"] = designer_agent
-    
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-    
+    def add_designer(state):
+        state.setdefault("agents", {})["Designer"] = designer_agent
+
+    # one locked read-modify-write; raises FileNotFoundError if the CEO agent has not run
+    state = store.update(add_designer)
     print("✅ Designer agent added to simulation state.")
     return state
 
 def ask_designer_for_mockups(state):
     """Ask Designer to propose UI mockups and style guidelines."""
     designer = state["agents"]["Designer"]
-    ceo_messages = [m for m in state["chat_history"] if m["from"] == "CEO"]
-    cto_messages = [m for m in state["chat_history"] if m["from"] == "CTO"]
     
+    context = build_context(state['chat_history'], 'Designer') or 'None'
     prompt = (
         f"{designer['system_prompt']}\n"
-        f"Long-term memory: {json.dumps(designer['memory']['long_term'], indent=2)}\n"
-        f"Recent CEO instructions: {json.dumps(ceo_messages[-1], indent=2) if ceo_messages else 'None'}\n"
-        f"Recent CTO plan: {json.dumps(cto_messages[-1], indent=2) if cto_messages else 'None'}\n"
+        f"{memory_context('Designer', context, seeds=designer['memory']['long_term']) or 'Relevant memory: none'}\n"
+        f"Recent CEO instructions and CTO plan: {context}\n"
         f"Question: Provide a UI/UX concept including color palette, layout, and feature highlights. "
         f"Respond in JSON with keys: layout, colors, typography, notes."
     )
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # you can swap for another GitHub model if needed
+    raw_output = complete_json(
+        get_router().route("Designer", "ask"),  # model per MODEL_ROUTES / MODEL_BACKEND (see model_backends.py)
         messages=[
             {"role": "system", "content": designer["system_prompt"]},
             {"role": "user", "content": prompt}
         ]
     )
-
-    raw_output = response.choices[0].message.content
+    remember("Designer", raw_output)  # short-term memory, recalled by later prompts
+    json_data, ok = parse_reply("Designer", raw_output)
+    if not ok:
+        print("\n⚠️ Could not parse JSON, storing raw output.")
 
     # Save conversation in state
-    state["chat_history"].append({
+    store.append_message(state, {
         "from": "Designer",
         "to": ["CEO", "CTO", "Marketer"],
         "timestamp": datetime.now().isoformat(),
         "type": "proposal",
         "subject": "UI/UX concept",
-        "body": raw_output
+        "body": json_data
     })
     
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-    
-    return raw_output
+    return json_data
 
 # --- Shared public function for new.py ---
 def generate_response(prompt: str):
     """Public function that can be imported in new.py"""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are the Designer agent."},
-                  {"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
+    return get_agent("Designer").generate(prompt)
 
 # --- Wrapper so new.py can import `designer_agent` ---
 def designer_agent(message: str) -> str:
     return generate_response(message)
 
 if __name__ == "__main__":
-    # Load state
-    with open(STATE_FILE, "r") as f:
-        state = json.load(f)
-    
     # Add Designer agent
     designer_agent_struct = create_designer_agent()
     state = update_state_with_designer(designer_agent_struct)
@@ -120,4 +103,4 @@ if __name__ == "__main__":
     print("💬 Asking Designer for UI/UX concepts...")
     answer = ask_designer_for_mockups(state)
     print("\n--- Designer's UI/UX Concept ---")
-    print(answer)
+    print(json.dumps(answer, indent=2))
@@ -8,19 +8,47 @@ export default function App() {
   const [loading, setLoading] = useState(false);
   const [conversation, setConversation] = useState([]);
 
+  // apply one Server-Sent Event from /simulate/stream to the conversation
+  function applyEvent(event, data) {
+    if (event === "turn_start") {
+      setConversation((prev) => [...prev, { from: data.from, to: data.to, response: "" }]);
+    } else if (event === "token" || event === "turn_end") {
+      setConversation((prev) => {
+        const next = prev.slice();
+        const last = next[next.length - 1];
+        const response = event === "token" ? last.response + data.text : data.response;
+        next[next.length - 1] = { ...last, response };
+        return next;
+      });
+    }
+  }
+
   async function runSimulation() {
     setLoading(true);
     setConversation([]);
     try {
-      const res = await fetch("http://127.0.0.1:8000/simulate", {
+      const res = await fetch("http://127.0.0.1:8000/simulate/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ prompt, max_rounds: rounds }),
       });
-      const data = await res.json();
-      setConversation(data.conversation || []);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop();
+        for (const frame of frames) {
+          const event = (frame.match(/^event: (.*)$/m) || [])[1];
+          const data = (frame.match(/^data: (.*)$/m) || [])[1];
+          if (event && data) applyEvent(event, JSON.parse(data));
+        }
+      }
     } catch (err) {
-      setConversation([{ from: "system", to: "frontend", response: `Error: ${err.message}` }]);
+      setConversation((prev) => [...prev, { from: "system", to: "frontend", response: `Error: ${err.message}` }]);
     } finally {
       setLoading(false);
     }
@@ -60,7 +88,7 @@ export default function App() {
           {conversation.length === 0 && <div className="no-messages">No messages yet.</div>}
           {conversation.map((m, i) => (
             <div key={i} className={`message ${m.from === "system" ? "system" : "agent"}`}>
-              <div className="from-to">{m.from} → {Array.isArray(m.to) ? m.to.join(", ") : m.to}</div>
+              <div className="from-to">{Array.isArray(m.from) ? m.from.join(", ") : m.from} → {Array.isArray(m.to) ? m.to.join(", ") : m.to}</div>
               <pre>{typeof m.response === "string" ? m.response : JSON.stringify(m.response, null, 2)}</pre>
             </div>
           ))}
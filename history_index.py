@@ -0,0 +1,130 @@
+# history_index.py
+"""Indexed, append-only conversation history.
+
+Agent prompts and the history endpoints used to filter the whole message
+list on every call ([m for m in history if m["from"] in senders]).
+HistoryIndex keeps, next to the messages, the positions of each sender's
+and each type's messages, so:
+  - latest(sender=...) is O(1)
+  - filtering by senders/type touches only the matching messages
+  - cursor pages are found by bisecting the position lists
+index_for() returns an index that follows a plain list (e.g. a state's
+chat_history) and only indexes the entries appended since the last call.
+
+Cursors are message positions in the full history, so a page filtered by
+sender still continues correctly as the history grows.
+"""
+import heapq
+from bisect import bisect_left
+from collections import OrderedDict
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class HistoryIndex:
+    def __init__(self, messages=(), sender_field="from"):
+        self.sender_field = sender_field
+        self.messages = []
+        self.by_sender = {}
+        self.by_type = {}
+        self.extend(messages)
+
+    def append(self, message):
+        position = len(self.messages)
+        self.messages.append(message)
+        senders = message.get(self.sender_field)
+        for sender in senders if isinstance(senders, list) else [senders]:
+            self.by_sender.setdefault(sender, []).append(position)
+        self.by_type.setdefault(message.get("type"), []).append(position)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, item):
+        return self.messages[item]
+
+    def latest(self, sender=None, type=None):
+        """Newest message from `sender` (and/or of `type`), or None."""
+        positions = self._positions(sender, type)
+        if positions is None:
+            return self.messages[-1] if self.messages else None
+        return self.messages[positions[-1]] if positions else None
+
+    def _positions(self, sender=None, type=None, senders=None):
+        """Sorted positions matching the filters; None means all messages."""
+        if sender is not None:
+            senders = [sender]
+        lists = []
+        if senders is not None:
+            by_sender = [self.by_sender.get(s, ()) for s in senders]
+            lists.append(by_sender[0] if len(by_sender) == 1 else list(heapq.merge(*by_sender)))
+        if type is not None:
+            lists.append(self.by_type.get(type, ()))
+        if not lists:
+            return None
+        if len(lists) == 1:
+            return lists[0]
+        wanted = set(lists[1])
+        return [p for p in lists[0] if p in wanted]
+
+    def select(self, senders=None, type=None, end=None):
+        """Messages (oldest first) from `senders` / of `type` before position `end`."""
+        end = len(self.messages) if end is None else end
+        positions = self._positions(type=type, senders=senders)
+        if positions is None:
+            return self.messages[:end]
+        return [self.messages[p] for p in positions[:bisect_left(positions, end)]]
+
+    def page(self, cursor=0, limit=PAGE_SIZE, sender=None, type=None):
+        """Up to `limit` messages at or after position `cursor`.
+        Returns (messages, next_cursor); next_cursor is None at the end."""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        positions = self._positions(sender, type)
+        if positions is None:
+            items = self.messages[cursor:cursor + limit]
+            following = cursor + limit
+            return items, following if following < len(self.messages) else None
+        start = bisect_left(positions, cursor)
+        chosen = positions[start:start + limit]
+        following = start + limit
+        next_cursor = positions[following] if following < len(positions) else None
+        return [self.messages[p] for p in chosen], next_cursor
+
+
+_indexes = OrderedDict()  # id(list) -> HistoryIndex, most recently used last
+_MAX_INDEXES = 64
+
+
+def index_for(history):
+    """HistoryIndex for a plain list, kept in sync incrementally (append-only lists)."""
+    if isinstance(history, HistoryIndex):
+        return history
+    key = id(history)
+    entry = _indexes.get(key)
+    if entry is None or entry[0] is not history or len(entry[1]) > len(history):
+        entry = _indexes[key] = (history, HistoryIndex())
+    _indexes.move_to_end(key)
+    while len(_indexes) > _MAX_INDEXES:
+        _indexes.popitem(last=False)
+    index = entry[1]
+    if len(index) < len(history):
+        index.extend(history[len(index):])
+    return index
+
+
+def encode_compact(messages):
+    """Columnar wire encoding: field names once, then one row per message."""
+    fields = []
+    for message in messages:
+        for field in message:
+            if field not in fields:
+                fields.append(field)
+    return {"fields": fields, "rows": [[message.get(f) for f in fields] for message in messages]}
@@ -0,0 +1,334 @@
+# job_queue.py
+"""Background job queue for long-running simulations.
+
+Submitting a job returns its ID immediately; a bounded pool of asyncio
+workers runs the jobs by priority (higher first, FIFO within a priority).
+The runner appends turns to job.conversation as they are produced, so
+status polls see the partial conversation grow. Jobs can be cancelled
+whether queued or running.
+
+Store calls run in threads (asyncio.to_thread) on snapshots of the jobs,
+so a slow or contended SQLite file never stalls the event loop; submit()
+and cancel() are coroutines for that reason.
+
+Passing a SQLite path persists jobs so queued (and interrupted) jobs are
+picked up again after a restart. The store can be shared by several
+processes (uvicorn workers, see backend/serve.py): a job is claimed
+atomically before it runs, so it runs on exactly one process, and every
+`sync_interval` seconds each queue saves the progress of its running jobs,
+honours cancels made through other processes and picks up queued jobs
+submitted elsewhere. Running jobs whose owner stopped heartbeating are
+requeued.
+
+Finished jobs are dropped from memory once they are persisted (get() reads
+them back from the store); without a store they are kept for
+JOB_RETENTION seconds.
+"""
+import os
+import copy
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+import itertools
+
+JOB_SYNC_INTERVAL = float(os.getenv("JOB_SYNC_INTERVAL", "1"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    def __init__(self, params, priority=0, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.priority = priority
+        self.status = QUEUED
+        self.conversation = []
+        self.done = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def snapshot(self):
+        """Copy to save from another thread while the runner keeps appending."""
+        job = copy.copy(self)
+        job.conversation = list(self.conversation)
+        return job
+
+    def summary(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "turns": len(self.conversation),
+            "done": self.done,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_COLUMNS = ("id, params, priority, status, conversation, done, error, "
+            "created_at, started_at, finished_at")
+
+
+class SQLiteJobStore:
+    """Persists jobs so the queue survives a process restart; safe to share
+    between processes (WAL mode, busy timeout, atomic claims). Calls block
+    (up to the busy timeout), so JobQueue makes them in threads; a lock
+    serializes them on the shared connection."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, params TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "status TEXT NOT NULL, conversation TEXT NOT NULL, done INTEGER NOT NULL, "
+            "error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "owner TEXT, heartbeat REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:  # store created by an older version
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._conn.commit()
+
+    def save(self, job):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({_COLUMNS}, heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = excluded.status, "
+                "conversation = excluded.conversation, done = excluded.done, error = excluded.error, "
+                "started_at = excluded.started_at, finished_at = excluded.finished_at, "
+                "heartbeat = excluded.heartbeat",
+                (job.id, json.dumps(job.params), job.priority, job.status,
+                 json.dumps(job.conversation), int(job.done), job.error,
+                 job.created_at, job.started_at, job.finished_at, time.time()),
+            )
+
+    @staticmethod
+    def _job(row):
+        job = Job(json.loads(row[1]), priority=row[2], job_id=row[0])
+        job.status, job.conversation, job.done, job.error = row[3], json.loads(row[4]), bool(row[5]), row[6]
+        job.created_at, job.started_at, job.finished_at = row[7], row[8], row[9]
+        return job
+
+    def load_all(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs ORDER BY created_at").fetchall()
+        return [self._job(row) for row in rows]
+
+    def load(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def load_queued(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def claim(self, job_id, owner):
+        """Atomically mark a queued job as running for `owner`; False if taken."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, started_at = ?, heartbeat = ? "
+                "WHERE id = ? AND status = ?", (RUNNING, owner, now, now, job_id, QUEUED))
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING))
+
+    def heartbeat(self, jobs):
+        """Save progress of running jobs; returns the IDs cancelled elsewhere."""
+        if not jobs:
+            return []
+        now = time.time()
+        marks = ",".join("?" * len(jobs))
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE jobs SET conversation = ?, heartbeat = ? WHERE id = ? AND status = ?",
+                    [(json.dumps(job.conversation), now, job.id, RUNNING) for job in jobs])
+            return [row[0] for row in self._conn.execute(
+                f"SELECT id FROM jobs WHERE status = ? AND id IN ({marks})",
+                [CANCELLED] + [job.id for job in jobs])]
+
+    def requeue_stale(self, before):
+        """Requeue running jobs whose owner has not heartbeated since `before`."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, conversation = '[]', started_at = NULL, owner = NULL "
+                "WHERE status = ? AND (heartbeat IS NULL OR heartbeat < ?)", (QUEUED, RUNNING, before))
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers running `runner(job)` coroutines."""
+
+    def __init__(self, runner, concurrency=4, store=None, sync_interval=JOB_SYNC_INTERVAL,
+                 retention=JOB_RETENTION):
+        self.runner = runner
+        self.concurrency = concurrency
+        self.store = store
+        self.sync_interval = sync_interval
+        self.retention = retention
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self._queue = None
+        self._seq = itertools.count()
+        self._tasks = {}
+        self._workers = []
+        self._finished = {}  # job_id -> finished_at, oldest first (no store only)
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        if self.store is not None:
+            # jobs interrupted by a restart start over from the beginning
+            await asyncio.to_thread(self.store.requeue_stale, time.time() - self._stale_after())
+            self._pick_up_queued(await asyncio.to_thread(self.store.load_queued))
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self.store is not None:
+            self._workers.append(asyncio.create_task(self._sync()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, params, priority=0):
+        self._expire()
+        job = Job(params, priority=priority)
+        self.jobs[job.id] = job
+        await self._save(job)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id):
+        """Local job if it runs here, otherwise the latest copy from the store."""
+        if self.store is None or job_id in self._tasks:
+            return self.jobs.get(job_id)
+        return self.store.load(job_id) or self.jobs.get(job_id)
+
+    async def cancel(self, job_id):
+        if self.store is not None and job_id not in self._tasks:
+            # queued here or running in another process: its owner picks this up
+            await asyncio.to_thread(self.store.cancel, job_id)
+            job = await asyncio.to_thread(self.store.load, job_id)
+            if job is not None and job_id in self.jobs:
+                self.jobs[job_id].status = job.status
+            return job
+        job = self.jobs.get(job_id)
+        if job is None or job.status in (DONE, FAILED, CANCELLED):
+            return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        await self._save(job)
+        if task is None:
+            self._retire(job)  # a running job is retired by its worker
+        return job
+
+    def _enqueue(self, job):
+        self._queue.put_nowait((-job.priority, next(self._seq), job.id))
+
+    async def _save(self, job):
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, job.snapshot())
+
+    def _retire(self, job):
+        """Drop a finished job from memory once it is in the store (or after retention)."""
+        if self.store is not None:
+            self.jobs.pop(job.id, None)
+        else:
+            self._finished[job.id] = job.finished_at or time.time()
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id, finished_at in list(self._finished.items()):
+            if finished_at >= cutoff:
+                break
+            del self._finished[job_id]
+            self.jobs.pop(job_id, None)
+
+    def _stale_after(self):
+        return max(5.0, 5 * self.sync_interval)
+
+    def _pick_up_queued(self, queued):
+        for job in queued:
+            local = self.jobs.get(job.id)
+            if local is None or local.status != QUEUED:
+                self.jobs[job.id] = job
+                self._enqueue(job)
+
+    async def _sync(self):
+        """Heartbeat running jobs and share cancels and queued jobs with other processes."""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                running = [self.jobs[job_id].snapshot() for job_id in list(self._tasks)]
+                for job_id in await asyncio.to_thread(self.store.heartbeat, running):
+                    task = self._tasks.get(job_id)
+                    if task is not None:
+                        self.jobs[job_id].status = CANCELLED
+                        self.jobs[job_id].finished_at = time.time()
+                        task.cancel()
+                await asyncio.to_thread(self.store.requeue_stale, time.time() - self._stale_after())
+                self._pick_up_queued(await asyncio.to_thread(self.store.load_queued))
+            except sqlite3.Error as e:
+                print(f"⚠️ Job store sync failed: {e}")
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                if job is not None and job.status in (DONE, FAILED, CANCELLED):
+                    self._retire(job)  # cancelled while queued
+                continue
+            if self.store is not None and not await asyncio.to_thread(self.store.claim, job_id, self.owner):
+                self.jobs.pop(job_id, None)  # cancelled, or claimed by another process
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            await self._save(job)
+            task = asyncio.create_task(self.runner(job))
+            self._tasks[job_id] = task
+            try:
+                job.done = bool(await task)
+                job.status = DONE
+            except asyncio.CancelledError:
+                # either this job was cancelled or the worker is shutting down
+                if job.status != CANCELLED:
+                    task.cancel()
+                    raise
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+            finally:
+                self._tasks.pop(job_id, None)
+                if job.status != RUNNING:
+                    job.finished_at = job.finished_at or time.time()
+                await self._save(job)
+                if job.status != RUNNING:
+                    self._retire(job)
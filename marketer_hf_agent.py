@@ -1,15 +1,16 @@
 # marketer_hf_agent.py (GitHub Models version)
-from openai import OpenAI
 import json
 from datetime import datetime
-import os
-from dotenv import load_dotenv
-STATE_FILE = "sim_state.json"
+from agent_engine import get_agent
+from state_store import StateStore
+from sessions import state_path
+from context_manager import build_context
+from structured_output import parse_reply
+from model_backends import complete_json, get_router
+from agent_memory import memory_context, remember
+STATE_FILE = state_path()  # per-run file when SIM_RUN_ID is set (see sessions.py)
+store = StateStore(STATE_FILE)
 
-client = OpenAI(
-    api_key=os.getenv("YOUR_API_KEY_HERE"),
-    base_url="https://models.inference.ai.azure.com"
-)
 
 # --- Step 1: Create Marketer agent ---
 def create_marketer_agent():
@@ -41,12 +42,12 @@ def create_marketer_agent():
 # --- Step 2: Ask Marketer for plan ---
 def ask_marketer_for_plan(state):
     marketer = state["agents"]["Marketer"]
-    ceo_messages = [m for m in state["chat_history"] if m["from"] == "CEO"]
 
+    context = build_context(state['chat_history'], 'Marketer') or 'None'
     prompt = (
         f"{marketer['system_prompt']}\n"
-        f"Long-term memory: {json.dumps(marketer['memory']['long_term'], indent=2)}\n"
-        f"Recent CEO instructions: {json.dumps(ceo_messages[-1], indent=2) if ceo_messages else 'None'}\n"
+        f"{memory_context('Marketer', context, seeds=marketer['memory']['long_term']) or 'Relevant memory: none'}\n"
+        f"Recent CEO instructions: {context}\n"
         "Question: What is your marketing plan? "
         "Respond ONLY in valid JSON format with the following structure:\n"
         "{\n"
@@ -56,32 +57,26 @@ def ask_marketer_for_plan(state):
         "}"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # you can swap to another GitHub-hosted model
+    raw_output = complete_json(
+        get_router().route("Marketer", "ask"),  # model per MODEL_ROUTES / MODEL_BACKEND (see model_backends.py)
         messages=[
             {"role": "system", "content": marketer["system_prompt"]},
             {"role": "user", "content": prompt}
         ]
     )
 
-    raw_output = response.choices[0].message.content
-
-    # Try to parse JSON
-    try:
-        json_data = json.loads(raw_output)
+    # Parse JSON (fenced or surrounded by prose); falls back to the raw text
+    remember("Marketer", raw_output)  # short-term memory, recalled by later prompts
+    json_data, ok = parse_reply("Marketer", raw_output)
+    if ok:
         print("\n--- Marketer's Plan (JSON) ---")
         print(json.dumps(json_data, indent=2))
-    except json.JSONDecodeError:
+    else:
         print("\n⚠️ Could not parse JSON, raw output:")
         print(raw_output.strip())
-        json_data = {
-            "campaigns": [],
-            "social_post": raw_output.strip(),
-            "growth_strategies": []
-        }
 
     # Save to state
-    state["chat_history"].append({
+    store.append_message(state, {
         "from": "Marketer",
         "to": ["CEO", "CTO", "Designer"],
         "timestamp": datetime.now().isoformat(),
@@ -90,39 +85,26 @@ def ask_marketer_for_plan(state):
         "body": json_data
     })
 
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
-
     return json_data
 
 # --- Shared public function for new.py ---
 def generate_response(prompt: str):
     """Allow other agents (or orchestrator) to ask the Marketer something."""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are the Marketer agent."},
-                  {"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content
+    return get_agent("Marketer").generate(prompt)
 
 # --- Wrapper so new.py can import `marketer_agent` ---
 def marketer_agent(message: str) -> str:
     return generate_response(message)
 
 if __name__ == "__main__":
-    # Load state
-    if not os.path.exists(STATE_FILE):
-        raise FileNotFoundError(f"{STATE_FILE} not found. Run CEO agent first.")
-
-    with open(STATE_FILE, "r") as f:
-        state = json.load(f)
-
-    # Overwrite marketer agent with the correct structure
+    # Overwrite marketer agent with the correct structure, in one locked
+    # read-modify-write (raises FileNotFoundError if the CEO agent has not run)
     marketer_agent_struct = create_marketer_agent()
-    state["agents"]["Marketer"] = marketer_agent_struct
 
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2)
+    def add_marketer(state):
+        state.setdefault("agents", {})["Marketer"] = marketer_agent_struct
+
+    state = store.update(add_marketer)
 
     # Ask Marketer for plan
     print("💬 Asking Marketer for plan...")
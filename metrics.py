@@ -0,0 +1,117 @@
+# metrics.py
+"""In-process instrumentation for model calls and orchestrator turns.
+
+Every agent call records its latency, prompt/completion tokens, cache hit
+or miss and failures; the backend records per-agent/per-round turn latency.
+render_prometheus() produces the text exposition format served at /metrics.
+Updates take a lock, so the threaded CLI path (new.py) is safe too.
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts, sum, count]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', bound))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+CALL_SECONDS = Histogram("agent_call_seconds", "Latency of agent model calls.", ("agent", "model"))
+CALL_TOKENS = Counter("agent_tokens_total", "Tokens used by agent model calls.", ("agent", "kind"))
+CACHE_LOOKUPS = Counter("agent_cache_lookups_total", "Response cache lookups by result.", ("agent", "result"))
+CALL_ERRORS = Counter("agent_call_errors_total", "Failed agent model calls.", ("agent", "error"))
+CALL_COALESCED = Counter("agent_coalesced_total", "Calls served by an identical in-flight call.", ("agent",))
+CALL_RETRIES = Counter("agent_call_retries_total", "Retried agent model calls.", ("agent",))
+SPECULATIONS = Counter("agent_speculations_total", "Speculative turn calls by outcome (started, hit, miss, discarded).",
+                       ("agent", "result"))
+TURN_SECONDS = Histogram("orchestrator_turn_seconds", "Latency of orchestrator turns.", ("agent", "round"))
+
+
+def record_call(agent, model, seconds, stats):
+    """Record one agent call; `stats` is the dict filled by response_cache."""
+    CALL_SECONDS.observe(seconds, agent=agent, model=model)
+    if "cached" in stats:
+        CACHE_LOOKUPS.inc(agent=agent, result="hit" if stats["cached"] else "miss")
+    if stats.get("prompt_tokens"):
+        CALL_TOKENS.inc(stats["prompt_tokens"], agent=agent, kind="prompt")
+    if stats.get("completion_tokens"):
+        CALL_TOKENS.inc(stats["completion_tokens"], agent=agent, kind="completion")
+    if stats.get("coalesced"):
+        CALL_COALESCED.inc(agent=agent)
+    if stats.get("retries"):
+        CALL_RETRIES.inc(stats["retries"], agent=agent)
+    if stats.get("error"):
+        CALL_ERRORS.inc(agent=agent, error=stats["error"])
+
+
+def record_turn(agent, round_idx, seconds):
+    TURN_SECONDS.observe(seconds, agent=agent, round=round_idx)
+
+
+def record_speculation(agent, result):
+    SPECULATIONS.inc(agent=agent, result=result)
+
+
+def render_prometheus():
+    with _lock:
+        lines = []
+        for metric in _metrics:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,281 @@
+# model_backends.py
+"""Pluggable model backends and per-agent / per-turn model routing.
+
+A model is named by a spec string "backend:model" (e.g. "local:echo" or
+"fast:llama-3.1-8b"); a plain model name uses MODEL_BACKEND (default
+"openai"). Backends:
+  - openai: any OpenAI-compatible endpoint, through the shared clients,
+    response cache, coalescing and retry layers (see response_cache.py).
+    Extra endpoints are declared in MODEL_BACKENDS, e.g.
+    {"fast": {"type": "openai", "base_url": "http://...", "api_key_env": "FAST_KEY"}}
+  - local: deterministic offline replies derived from a hash of the request,
+    for tests and air-gapped runs (MODEL_BACKEND=local needs no network,
+    API key or openai package). JSON is returned with the keys a prompt asks for.
+
+ModelRouter picks the model for each call from MODEL_ROUTES (inline JSON
+or a path to a JSON file):
+    {"default": "gpt-4o-mini",
+     "agents": {"CEO": "gpt-4o"},
+     "turns": {"relay": "gpt-4o-mini", "CEO:synthesis": ["gpt-4o", "gpt-4o-mini"]}}
+Precedence: "<agent>:<turn>", then "<turn>", then the agent, then the
+agent spec's own model, then "default". Turn types used by the
+orchestrators are kickoff, relay (a teammate's turn) and synthesis (a CEO
+turn after the kickoff); the CLI agents use "ask".
+
+A route may list several candidates. The router then takes the cheapest
+(MODEL_COSTS, relative cost per 1M output tokens) whose observed latency -
+an EWMA over live calls - is within ROUTER_LATENCY_TARGET seconds; models
+without observations count as within target, and if none qualifies the
+fastest one is used. With no target (0) the cheapest candidate wins.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+from response_cache import cached_completion, acached_completion, acached_stream
+from structured_output import json_response_format, json_mode_rejected
+
+DEFAULT_MODEL = os.getenv("AGENT_MODEL", "gpt-4o-mini")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "openai")
+ROUTER_LATENCY_TARGET = float(os.getenv("ROUTER_LATENCY_TARGET", "0"))
+LATENCY_EWMA_ALPHA = 0.2
+
+# relative cost per 1M output tokens; override or extend with MODEL_COSTS
+MODEL_COSTS = {"gpt-4o-mini": 0.6, "gpt-4o": 10.0, "gpt-4.1-nano": 0.4, "gpt-4.1-mini": 1.6, "gpt-4.1": 8.0}
+
+TURN_TYPES = ("kickoff", "relay", "synthesis", "ask")
+
+
+def _load_json(value):
+    """Inline JSON or the path of a JSON file; {} when unset."""
+    if not value:
+        return {}
+    if value.lstrip().startswith("{"):
+        return json.loads(value)
+    with open(value, "r") as f:
+        return json.load(f)
+
+
+class OpenAIBackend:
+    """An OpenAI-compatible endpoint (the default GitHub Models one unless base_url is set)."""
+
+    def __init__(self, base_url=None, api_key_env="YOUR_API_KEY_HERE"):
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+
+    def preload(self):
+        from shared_client import get_async_client
+        get_async_client(self.base_url, self.api_key_env)
+
+    def complete(self, model, messages, stats=None, response_format=None):
+        from shared_client import get_client
+        return cached_completion(get_client(self.base_url, self.api_key_env), model, messages,
+                                 stats=stats, response_format=response_format)
+
+    async def acomplete(self, model, messages, stats=None, response_format=None):
+        from shared_client import get_async_client
+        return await acached_completion(get_async_client(self.base_url, self.api_key_env), model, messages,
+                                        stats=stats, response_format=response_format)
+
+    def astream(self, model, messages, stats=None, response_format=None):
+        from shared_client import get_async_client
+        return acached_stream(get_async_client(self.base_url, self.api_key_env), model, messages,
+                              stats=stats, response_format=response_format)
+
+
+class LocalBackend:
+    """Deterministic offline model: the same request always gets the same reply.
+
+    Replies are built from a fixed vocabulary seeded by a hash of the model
+    and messages. If the request is in JSON mode or the last user turn asks
+    for JSON keys, the reply is a JSON object with those keys.
+    `latency` (seconds) simulates a slow model.
+    """
+
+    WORDS = ("build", "launch", "users", "market", "design", "product", "roadmap", "budget", "growth",
+             "feature", "team", "metrics", "pricing", "onboarding", "feedback", "mobile", "api", "brand",
+             "retention", "partners", "security", "data", "campaign", "prototype", "release", "insight")
+
+    def __init__(self, reply_words=40, latency=0.0):
+        self.reply_words = reply_words
+        self.latency = latency
+
+    def preload(self):
+        pass
+
+    @staticmethod
+    def requested_keys(text):
+        """JSON keys a prompt asks for: {key: "string" | "list"}."""
+        keys = {}
+        marker = text.rfind("keys:")
+        if marker != -1:
+            listed = text[marker + 5:].split(".")[0]
+            for item in listed.split(","):
+                name = item.split("(")[0].strip().strip('"')
+                if name.replace("_", "").isalnum():
+                    keys[name] = "list" if "(list)" in item else "string"
+            return keys
+        # a JSON skeleton in the prompt, e.g. '"messages": [],'
+        for line in text.splitlines():
+            name, sep, rest = line.strip().partition('":')
+            if sep and name.startswith('"'):
+                keys[name[1:]] = "list" if rest.strip().startswith("[") else "string"
+        return keys
+
+    def reply(self, model, messages, response_format=None):
+        seed = hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode()).digest()
+        rng = random.Random(seed)
+        sentence = lambda n: " ".join(rng.choice(self.WORDS) for _ in range(n)).capitalize() + "."
+        prompt = messages[-1]["content"] if messages else ""
+        keys = self.requested_keys(prompt) if "JSON" in prompt or response_format else {}
+        if not keys and response_format is None:
+            return sentence(self.reply_words)
+        per_key = max(4, self.reply_words // max(1, len(keys)))
+        data = {key: [sentence(per_key // 2), sentence(per_key // 2)] if kind == "list" else sentence(per_key)
+                for key, kind in keys.items()}
+        if "status" in prompt:
+            data.setdefault("status", "CONTINUE")
+        return json.dumps(data)
+
+    def _usage(self, messages, content, stats):
+        if stats is not None:
+            stats["prompt_tokens"] = sum(len(m.get("content") or "") for m in messages) // 4
+            stats["completion_tokens"] = len(content) // 4
+
+    def complete(self, model, messages, stats=None, response_format=None):
+        if self.latency:
+            time.sleep(self.latency)
+        content = self.reply(model, messages, response_format)
+        self._usage(messages, content, stats)
+        return content
+
+    async def acomplete(self, model, messages, stats=None, response_format=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = self.reply(model, messages, response_format)
+        self._usage(messages, content, stats)
+        return content
+
+    async def astream(self, model, messages, stats=None, response_format=None):
+        content = await self.acomplete(model, messages, stats, response_format)
+        for i in range(0, len(content), 16):
+            yield content[i:i + 16]
+
+
+BACKEND_TYPES = {"openai": OpenAIBackend, "local": LocalBackend}
+
+_backends = {"openai": OpenAIBackend(), "local": LocalBackend()}
+_backends_loaded = False
+
+
+def register_backend(name, backend):
+    """Register (or replace) a backend under `name` ("name:model" specs use it)."""
+    _backends[name] = backend
+    return backend
+
+
+def _load_configured():
+    global _backends_loaded
+    if not _backends_loaded:
+        _backends_loaded = True
+        for name, options in _load_json(os.getenv("MODEL_BACKENDS")).items():
+            options = dict(options)
+            register_backend(name, BACKEND_TYPES[options.pop("type", "openai")](**options))
+
+
+def resolve(model_spec):
+    """Split a model spec into (backend, model name)."""
+    _load_configured()
+    name, sep, model = model_spec.partition(":")
+    if sep and name in _backends:
+        return _backends[name], model
+    if MODEL_BACKEND not in _backends:
+        raise KeyError(f"Unknown model backend: {MODEL_BACKEND}")
+    return _backends[MODEL_BACKEND], model_spec
+
+
+def preload_backends():
+    """Create the pooled clients of the default and the configured backends."""
+    _load_configured()
+    for name, backend in _backends.items():
+        if name == MODEL_BACKEND or name not in ("openai", "local"):
+            backend.preload()
+
+
+class ModelRouter:
+    """Choose a model spec per (agent, turn type); see the module docstring."""
+
+    def __init__(self, routes=None, costs=None, latency_target=ROUTER_LATENCY_TARGET):
+        routes = routes or {}
+        self.default = routes.get("default")
+        self.agents = routes.get("agents", {})
+        self.turns = routes.get("turns", {})
+        self.costs = dict(MODEL_COSTS, **(costs or {}))
+        self.latency_target = latency_target
+        self.latency = {}  # model spec -> EWMA seconds of live calls
+        self._lock = threading.Lock()
+
+    def candidates(self, agent_id, turn=None, fallback=None):
+        for route in (self.turns.get(f"{agent_id}:{turn}"), self.turns.get(turn), self.agents.get(agent_id),
+                      fallback, self.default, DEFAULT_MODEL):
+            if route:
+                return [route] if isinstance(route, str) else list(route)
+
+    def cost(self, model_spec):
+        backend, model = resolve(model_spec)
+        if isinstance(backend, LocalBackend):
+            return 0.0
+        return self.costs.get(model, float("inf"))
+
+    def route(self, agent_id, turn=None, fallback=None):
+        """Model spec for one call by `agent_id` in a `turn` of the given type."""
+        candidates = self.candidates(agent_id, turn, fallback)
+        if len(candidates) == 1:
+            return candidates[0]
+        with self._lock:
+            latency = dict(self.latency)
+        pool = [m for m in candidates if not self.latency_target or latency.get(m, 0.0) <= self.latency_target]
+        if not pool:
+            return min(candidates, key=lambda m: latency[m])
+        return min(pool, key=lambda m: (self.cost(m), candidates.index(m)))
+
+    def observe(self, model_spec, seconds):
+        """Record the latency of a live (uncached) call."""
+        with self._lock:
+            previous = self.latency.get(model_spec)
+            self.latency[model_spec] = seconds if previous is None else \
+                previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+
+    def stats(self):
+        with self._lock:
+            latency = {m: round(s, 3) for m, s in self.latency.items()}
+        return {"backend": MODEL_BACKEND, "latency_target": self.latency_target,
+                "default": self.default or DEFAULT_MODEL, "agents": self.agents, "turns": self.turns,
+                "latency_ewma": latency}
+
+
+_router = None
+
+
+def get_router():
+    """Process-wide router configured from MODEL_ROUTES / MODEL_COSTS."""
+    global _router
+    if _router is None:
+        _router = ModelRouter(_load_json(os.getenv("MODEL_ROUTES")), _load_json(os.getenv("MODEL_COSTS")))
+    return _router
+
+
+def complete_json(model_spec, messages, stats=None):
+    """Blocking completion in JSON mode when the provider supports it."""
+    backend, model = resolve(model_spec)
+    response_format = json_response_format()
+    try:
+        return backend.complete(model, messages, stats=stats, response_format=response_format)
+    except Exception as e:
+        if response_format is None or not json_mode_rejected(e):
+            raise
+        return backend.complete(model, messages, stats=stats)
@@ -1,26 +1,35 @@
-from ceo_hf_agent import ceo_agent
-from cto_hf_agent import cto_agent
-from marketer_hf_agent import marketer_agent
-from designer_hf_agent import designer_agent
+import asyncio
+from agent_engine import get_agent
+from response_cache import get_cache
+from convergence import ConvergenceDetector
+from workflow import critical_path, execute, load_workflow, unroll
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Shared conversation state
 conversation = []
 
-# Agent registry
-agents = {
-    "CEO": ceo_agent,
-    "CTO": cto_agent,
-    "Designer": designer_agent,
-    "Marketer": marketer_agent
-}
-
 # Order of speaking
 agent_order = ["CEO", "CTO", "Designer", "Marketer"]
 
-def send_message(agent_name, message, from_agent="SYSTEM"):
-    """Send message to one agent and store reply."""
-    agent_fn = agents[agent_name]
-    response = agent_fn(f"{from_agent}: {message}")
+# Agents the CEO broadcasts to in parallel mode
+team = ["CTO", "Designer", "Marketer"]
+
+def turn_type(agent_name, from_agent):
+    """Turn type for model routing (see model_backends.py)."""
+    if agent_name == from_agent:
+        return "kickoff"
+    return "synthesis" if agent_name == "CEO" else "relay"
+
+def send_message(agent_name, message, from_agent="SYSTEM", detector=None):
+    """Send message to one agent and store reply.
+    Agent calls go through the shared response cache (see response_cache.py),
+    so replaying an identical message does not hit the model again."""
+    agent = get_agent(agent_name)  # shared registry, see agent_engine.py
+    stats = {}
+    response = agent.generate(f"{from_agent}: {message}", stats=stats,
+                              turn=turn_type(agent_name, from_agent))
+    if detector is not None:
+        detector.add_tokens(stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0))
 
     conversation.append({
         "from": from_agent,
@@ -33,13 +42,111 @@ def send_message(agent_name, message, from_agent="SYSTEM"):
     print(response)
     return response
 
-def run_interaction(max_rounds=5):
+STOP_MESSAGES = {
+    "done": "✅ Conversation reached conclusion.",
+    "stalled": "✅ Conversation converged (no new content).",
+    "token_budget": "⚠️ Token budget used up, stopping conversation.",
+    "time_budget": "⚠️ Time budget used up, stopping conversation.",
+}
+
+def finish(reason):
+    print("\n" + STOP_MESSAGES.get(reason, "⚠️ Max rounds reached, stopping conversation."))
+    print("=== Simulation Ends ===")
+    return reason
+
+def observe(detector, response):
+    error = isinstance(response, str) and response.startswith("ERROR calling ")
+    return detector.observe(response, error=error)
+
+def broadcast(message, from_agent="CEO", timeout=120, detector=None):
+    """Send one message to the whole team concurrently and collect replies.
+    A failing or slow agent yields an ERROR reply instead of stopping the round;
+    the round never waits longer than `timeout` seconds."""
+    pool = ThreadPoolExecutor(max_workers=len(team))
+    try:
+        futures = {name: pool.submit(send_message, name, message, from_agent, detector) for name in team}
+        wait(futures.values(), timeout=timeout)
+        replies = {}
+        for name, future in futures.items():
+            if not future.done():
+                replies[name] = f"ERROR calling {name} agent: timed out after {timeout}s"
+            elif future.exception() is not None:
+                replies[name] = f"ERROR calling {name} agent: {future.exception()}"
+            else:
+                replies[name] = future.result()
+    finally:
+        # don't block on a slow agent's thread; it finishes in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+    return replies
+
+def run_workflow(msg, max_rounds, detector, workflow=None):
+    """Run a workflow of turns (see workflow.py): each agent is called as soon
+    as the turns it depends on are done, independent ones in parallel threads.
+    A turn taking longer than its node timeout becomes an ERROR reply."""
+    nodes = unroll(load_workflow(workflow), max_rounds)
+    agents = {node.id: node.agent for node in nodes}
+    replies = {}
+    print(f"🔀 {len(nodes)} turns, critical path {critical_path(nodes)} turns")
+
+    pool = ThreadPoolExecutor()
+
+    async def call(node, message, from_agent):
+        future = asyncio.get_running_loop().run_in_executor(pool, send_message, node.agent, message, from_agent,
+                                                            detector)
+        try:
+            return await asyncio.wait_for(future, node.timeout)
+        except asyncio.TimeoutError:
+            return f"ERROR calling {node.agent} agent: timed out after {node.timeout}s"
+
+    async def run_node(node):
+        if not node.inputs:
+            return await call(node, msg, node.agent)
+        if len(node.inputs) == 1:
+            source = node.inputs[0]
+            return await call(node, replies[source], agents[source])
+        merged = "\n\n".join(f"{agents[i]}: {replies[i]}" for i in node.inputs)
+        return await call(node, merged, "Team")
+
+    def on_done(node, response):
+        replies[node.id] = response
+        return observe(detector, response)
+
+    try:
+        stopped = asyncio.run(execute(nodes, run_node, on_done))
+    finally:
+        # like broadcast: a timed-out agent's thread is not waited for
+        pool.shutdown(wait=False, cancel_futures=True)
+    return finish(detector.reason if stopped else "max_rounds")
+
+def run_interaction(max_rounds=5, parallel=False, detector=None, dag=False, workflow=None):
+    """Run the simulation; stops early on DONE, stalled turns or an exhausted
+    budget (see convergence.py). Returns the stop reason ("max_rounds" if none).
+    dag=True runs the turn workflow instead of the fixed order (see workflow.py);
+    `workflow` is a list of steps or a JSON file path (default: WORKFLOW_PATH)."""
     print("=== Startup Simulation Begins ===")
+    detector = detector or ConvergenceDetector()
 
     # Kickoff from CEO
     msg = "We need to build an AI-powered personal finance assistant."
+    if dag:
+        return run_workflow(msg, max_rounds, detector, workflow)
     current_speaker = "CEO"
-    response = send_message(current_speaker, msg, from_agent="CEO")
+    response = send_message(current_speaker, msg, from_agent="CEO", detector=detector)
+    if observe(detector, response):
+        return finish(detector.reason)
+
+    if parallel:
+        # Fan-out: team replies concurrently, CEO synthesizes
+        for round_num in range(max_rounds):
+            print(f"\n--- Round {round_num+1} (parallel) ---")
+            replies = broadcast(response, from_agent="CEO", detector=detector)
+            if any([observe(detector, r) for r in replies.values()]):
+                return finish(detector.reason)
+            merged = "\n\n".join(f"{name}: {reply}" for name, reply in replies.items())
+            response = send_message("CEO", merged, from_agent="Team", detector=detector)
+            if observe(detector, response):
+                return finish(detector.reason)
+        return finish("max_rounds")
 
     # Conversation loop
     for round_num in range(max_rounds):
@@ -51,23 +158,21 @@ def run_interaction(max_rounds=5):
             next_agent = agent_order[next_index]
 
             # Pass the last response forward
-            response = send_message(next_agent, response, from_agent=speaker)
-
-            # If someone says "DONE", break out
-            if isinstance(response, dict):
-                if response.get("status", "").upper() == "DONE":
-                    print("\n✅ All agents have completed their tasks.")
-                    print("=== Simulation Ends ===")
-                    return
-            elif isinstance(response, str):
-                if "DONE" in response.upper():
-                    print("\n✅ Conversation reached conclusion.")
-                    print("=== Simulation Ends ===")
-                    return
-
-    print("\n⚠️ Max rounds reached, stopping conversation.")
-    print("=== Simulation Ends ===")
+            response = send_message(next_agent, response, from_agent=speaker, detector=detector)
+
+            # Stop on an explicit DONE, stalled turns or an exhausted budget
+            if observe(detector, response):
+                return finish(detector.reason)
+
+    return finish("max_rounds")
+
+
+def print_cache_stats():
+    cache = get_cache()
+    if cache is not None:
+        print(f"\n📦 Response cache: {cache.stats()}")
 
 
 if __name__ == "__main__":
     run_interaction()
+    print_cache_stats()
@@ -0,0 +1,304 @@
+# orchestrator.py
+"""Simulation orchestration shared by backend/app.py and sweep.py.
+
+A run is a kickoff CEO turn followed by max_rounds rounds, either
+round-robin (CEO -> CTO -> Designer -> Marketer -> CEO ...) or fan-out (the
+CEO's message goes to the team concurrently, then the CEO synthesizes).
+Runs are described by a params dict (prompt, max_rounds, mode, structured,
+token/time budgets and an optional niche for the CEO), so the same run can
+be started by /simulate, a background job, a resume or a sweep.
+"""
+import os
+import time
+import uuid
+import asyncio
+
+from agent_engine import AgentSpec, get_agent
+from context_manager import build_prompt
+from metrics import record_turn
+from structured_output import parse_reply
+from convergence import ConvergenceDetector
+from history_index import HistoryIndex
+from agent_memory import SHORT_TERM, aforget_run, aremember
+from workflow import execute, load_workflow, unroll
+
+AGENT_ORDER = ["CEO", "CTO", "Designer", "Marketer"]
+TEAM = ["CTO", "Designer", "Marketer"]
+
+# per-agent timeout (seconds) for concurrent fan-out calls
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "120"))
+
+def is_error(response):
+    """True for the placeholder reply of a failed agent call."""
+    return isinstance(response, str) and response.startswith("ERROR calling ")
+
+def make_turn(sender, recipient, agent, response, structured=False):
+    """
+    Conversation entry for one turn. Structured replies are parsed once here;
+    "response" keeps the raw text, which is what later prompts quote.
+    """
+    turn = {"from": sender, "to": recipient, "response": response}
+    if structured and not is_error(response):
+        turn["data"] = parse_reply(agent, response)[0]
+    return turn
+
+def make_detector(params):
+    """Convergence detector for one run; request budgets override the defaults."""
+    detector = ConvergenceDetector()
+    if params.get("token_budget"):
+        detector.token_budget = int(params["token_budget"])
+    if params.get("time_budget"):
+        detector.time_budget = float(params["time_budget"])
+    return detector
+
+def turn_type(agent, round_idx):
+    """Turn type for model routing (see model_backends.py)."""
+    if round_idx == 0:
+        return "kickoff"
+    return "synthesis" if agent == "CEO" else "relay"
+
+def observe(detector, turn):
+    """Feed a conversation entry to the detector; returns the stop reason or None."""
+    return detector.observe(turn["response"], turn.get("data"), error=is_error(turn["response"]))
+
+async def call_agent(agent, prompt, timeout=None, round_idx=0, timings=None, structured=False,
+                     detector=None, stats=None, spec=None, run_id=None):
+    """
+    Call one agent, turning failures and timeouts into an ERROR reply.
+    The turn is recorded in metrics and, if given, appended to `timings`
+    as a compact {agent, round, model, ms, tokens, cached} summary.
+    `spec` overrides the registered agent (e.g. a per-niche CEO); `run_id`
+    scopes the agent's short-term memory (see agent_memory.py).
+    """
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for((spec or get_agent(agent)).agenerate(
+            prompt, stats=stats, structured=structured, turn=turn_type(agent, round_idx), run_id=run_id), timeout)
+    except asyncio.TimeoutError:
+        stats["error"] = "timeout"
+        response = f"ERROR calling {agent} agent: timed out after {timeout}s"
+    except Exception as e:
+        response = f"ERROR calling {agent} agent: {e}"
+    seconds = time.perf_counter() - start
+    record_turn(agent, round_idx, seconds)
+    if detector is not None:
+        detector.add_tokens(stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0))
+    if timings is not None:
+        timings.append({
+            "agent": agent, "round": round_idx, "model": stats.get("model"), "ms": round(seconds * 1000, 1),
+            "tokens": stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0),
+            "cached": stats.get("cached", False), "error": stats.get("error"),
+        })
+    return response
+
+class Run:
+    """
+    State of one simulation run, shared by its turns. With a session, turns
+    checkpointed by an earlier attempt are replayed (no model call) until the
+    first one that is missing; from there on every turn is live and is
+    checkpointed as it completes. Failed turns are not checkpointed, so a
+    resume retries them. Checkpoints are written in order in a thread (file
+    lock + fsync stay off the event loop); flush() waits for them.
+    """
+    def __init__(self, conversation, timings=None, structured=False, detector=None, session=None,
+                 agents=None):
+        self.conversation = conversation
+        self.timings = timings
+        self.structured = structured
+        self.detector = detector or ConvergenceDetector()
+        self.session = session
+        self.agents = agents or {}  # agent id -> AgentSpec overriding the registry
+        self.run_id = session.run_id if session is not None else uuid.uuid4().hex
+        self.replaying = session is not None
+        self.history = HistoryIndex()  # messages keyed by their author, for the context manager
+        self.replayed = 0
+        self._checkpointing = None  # latest checkpoint write; each waits for the previous one
+
+    async def call(self, agent, prompt, sender, recipient, round_idx=0, timeout=None, replay=None):
+        """
+        Replay or run one agent turn; returns (turn entry, tokens, live).
+        `replay` overrides the replay-the-prefix rule (the DAG scheduler
+        replays a turn whenever all of its inputs were replayed).
+        """
+        if self.session is not None and (self.replaying if replay is None else replay):
+            entry = self.session.recorded(round_idx, agent)
+            if entry is not None:
+                self.detector.add_tokens(entry["tokens"])
+                await aremember(agent, entry["turn"]["response"], SHORT_TERM, self.run_id)
+                self.replayed += 1
+                return entry["turn"], entry["tokens"], False
+            if replay is None:
+                self.replaying = False
+        stats = {}
+        response = await call_agent(agent, prompt, timeout, round_idx, self.timings, self.structured,
+                                    self.detector, stats, self.agents.get(agent), self.run_id)
+        tokens = stats.get("prompt_tokens", 0) + stats.get("completion_tokens", 0)
+        return make_turn(sender, recipient, agent, response, self.structured), tokens, True
+
+    def commit(self, agent, round_idx, result):
+        """Record a turn from call(); returns the stop reason or None."""
+        turn, tokens, live = result
+        self.conversation.append(turn)
+        # a failed call (after retries) is reported but never becomes the
+        # next agent's prompt; the next agent works from the last good turn
+        if not is_error(turn["response"]):
+            self.history.append({"from": agent, "response": turn["response"]})
+            if live and self.session is not None:
+                self._checkpoint(round_idx, agent, turn, tokens)
+        return observe(self.detector, turn)
+
+    def _checkpoint(self, round_idx, agent, turn, tokens):
+        previous = self._checkpointing
+
+        async def write():
+            if previous is not None:
+                await previous
+            await asyncio.to_thread(self.session.checkpoint, round_idx, agent, turn, tokens)
+        self._checkpointing = asyncio.ensure_future(write())
+
+    async def flush(self):
+        """Wait for pending checkpoint writes (re-raises a failed write)."""
+        if self._checkpointing is not None:
+            await self._checkpointing
+
+async def run_fanout(initial, max_rounds, run):
+    """
+    Run a fan-out simulation: each round the CEO's latest message goes to
+    CTO, Designer and Marketer concurrently; their replies (including any
+    per-agent failures) are merged back for the CEO's synthesis turn.
+    A round costs roughly the slowest agent rather than the sum of all four.
+    """
+    result = await run.call("CEO", f"CEO: {initial}", "CEO", TEAM)
+    if run.commit("CEO", 0, result):
+        return True
+
+    for round_idx in range(max_rounds):
+        prompts = [build_prompt(run.history, agent) for agent in TEAM]
+        results = await asyncio.gather(*(run.call(agent, prompt, "CEO", agent, round_idx + 1, FANOUT_TIMEOUT)
+                                         for agent, prompt in zip(TEAM, prompts)))
+        stop = None
+        for agent, result in zip(TEAM, results):
+            stop = run.commit(agent, round_idx + 1, result) or stop
+        if stop:
+            return True
+
+        # CEO synthesis turn sees all three replies verbatim
+        result = await run.call("CEO", build_prompt(run.history, "CEO", latest=len(TEAM)), TEAM, "CEO",
+                                round_idx + 1)
+        if run.commit("CEO", round_idx + 1, result):
+            return True
+
+    return False
+
+async def run_dag(initial, max_rounds, run, workflow=None):
+    """
+    Run a workflow of agent turns (see workflow.py): each turn starts as soon
+    as the turns it takes as input are done, so independent turns run
+    concurrently. A turn's prompt quotes its inputs verbatim after the
+    summarized output of all earlier turns it depends on.
+    """
+    nodes = unroll(load_workflow(workflow), max_rounds)
+    agents = {node.id: node.agent for node in nodes}
+    results = {}  # node id -> (turn, tokens, live), shared by all dependents
+
+    def messages(node_ids):
+        return [{"from": agents[i], "response": results[i][0]["response"]}
+                for i in node_ids if not is_error(results[i][0]["response"])]
+
+    async def run_node(node):
+        if not node.inputs:
+            return await run.call(node.agent, f"{node.agent}: {initial}", node.agent, TEAM, node.round,
+                                  node.timeout, replay=True)
+        latest = messages(node.inputs)
+        earlier = messages(i for i in node.ancestors if i not in node.inputs)
+        prompt = build_prompt(earlier + latest, node.agent, latest=max(1, len(latest)))
+        senders = [agents[i] for i in node.inputs]
+        # a checkpointed turn is still valid if nothing it depends on was re-run
+        replay = not any(results[i][2] for i in node.ancestors)
+        return await run.call(node.agent, prompt, senders[0] if len(senders) == 1 else senders, node.agent,
+                              node.round, node.timeout, replay=replay)
+
+    def on_done(node, result):
+        results[node.id] = result
+        return run.commit(node.agent, node.round, result)
+
+    return await execute(nodes, run_node, on_done)
+
+async def run_simulation(initial, max_rounds, conversation, mode="round_robin", timings=None,
+                         structured=False, detector=None, session=None, agents=None, workflow=None):
+    """
+    Run a round-robin simulation:
+      CEO -> CTO -> Designer -> Marketer -> CEO -> ...
+    (or "fanout" / "dag" with an optional `workflow`, see run_dag).
+    Turns are appended to `conversation` as they complete, so callers
+    (e.g. background jobs) can observe partial progress.
+    Returns True if the run stopped before max_rounds; detector.reason says
+    why (done, stalled, token_budget or time_budget).
+    With a session, every completed turn is checkpointed and an interrupted
+    run continues from its last completed turn (see Run).
+    """
+    run = Run(conversation, timings, structured, detector, session, agents)
+    try:
+        if mode == "fanout":
+            return await run_fanout(initial, max_rounds, run)
+        if mode == "dag":
+            return await run_dag(initial, max_rounds, run, workflow)
+        return await run_round_robin(initial, max_rounds, run)
+    finally:
+        await run.flush()
+        await aforget_run(run.run_id)  # the run's short-term memory (see agent_memory.py)
+
+async def run_round_robin(initial, max_rounds, run):
+    """CEO kickoff, then CEO -> CTO -> Designer -> Marketer -> CEO -> ... each round."""
+    agent_order = AGENT_ORDER
+
+    # Kickoff: CEO receives the initial prompt
+    result = await run.call("CEO", f"CEO: {initial}", "CEO", ["CTO","Designer","Marketer"])
+    if run.commit("CEO", 0, result):
+        return True
+
+    # Run rounds
+    for round_idx in range(max_rounds):
+        for i, speaker in enumerate(agent_order):
+            next_agent = agent_order[(i + 1) % len(agent_order)]
+
+            # latest message verbatim plus summarized relevant history
+            prompt = build_prompt(run.history, next_agent)
+
+            # call next agent (or replay its checkpointed turn)
+            result = await run.call(next_agent, prompt, speaker, next_agent, round_idx + 1)
+
+            # stop early on an explicit DONE, stalled turns or an exhausted budget
+            if run.commit(next_agent, round_idx + 1, result):
+                return True
+
+    return False
+
+def agents_for(params):
+    """Per-run agent overrides: a CEO for params["niche"] when it is set."""
+    niche = params.get("niche")
+    if not niche:
+        return None
+    from ceo_hf_agent import create_ceo_agent
+    return {"CEO": AgentSpec.from_dict(create_ceo_agent(niche))}
+
+async def run_params(params, conversation, timings=None, session=None):
+    """Run a simulation from stored params; returns (done, stop_reason)."""
+    detector = make_detector(params)
+    try:
+        done = await run_simulation(params["prompt"], params["max_rounds"], conversation,
+                                    mode=params.get("mode", "round_robin"), timings=timings,
+                                    structured=params.get("structured", False),
+                                    detector=detector, session=session, agents=agents_for(params),
+                                    workflow=params.get("workflow"))
+    except asyncio.CancelledError:
+        raise  # the session stays "running" and can be resumed
+    except Exception as e:
+        if session is not None:
+            await asyncio.to_thread(session.finish, error=str(e))
+        raise
+    reason = detector.reason or "max_rounds"
+    if session is not None:
+        await asyncio.to_thread(session.finish, done, reason)
+    return done, reason
@@ -0,0 +1,219 @@
+# resilience.py
+"""Resilient model-call layer shared by every agent call.
+
+A transient 429/5xx used to surface as an "ERROR calling X agent" string
+that the next agent then received as its prompt. Calls now go through:
+  - a token-bucket limiter shared by all concurrent simulations in the
+    process, which also pauses when the provider's rate-limit headers
+    (x-ratelimit-remaining-requests / retry-after) say we are out of quota
+  - retries with full-jitter exponential backoff for retryable errors
+  - a circuit breaker that fails fast after repeated failures and lets a
+    single probe through once the reset timeout has passed
+Settings (environment):
+  MODEL_RPS=0 (0 = no client-side limit), MODEL_BURST=10,
+  MODEL_MAX_RETRIES=4, MODEL_BACKOFF_BASE=0.5, MODEL_BACKOFF_MAX=20,
+  BREAKER_FAILURES=5, BREAKER_RESET=30
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+
+MODEL_RPS = float(os.getenv("MODEL_RPS", "0"))
+MODEL_BURST = float(os.getenv("MODEL_BURST", "10"))
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("MODEL_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("MODEL_BACKOFF_MAX", "20"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker is open and calls fail fast."""
+
+
+def _parse_seconds(value):
+    """Parse header durations like '1', '0.5', '6m0s', '20ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, number = 0.0, ""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == ".":
+            number += ch
+            i += 1
+            continue
+        unit = "ms" if value[i:i + 2] == "ms" else ch
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+    return total
+
+
+class TokenBucket:
+    """Rate limiter shared by threads and coroutines (reservation based)."""
+
+    def __init__(self, rate=MODEL_RPS, burst=MODEL_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take one token; return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.rate <= 0:
+                return wait
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, status_code, headers):
+        """Back off for everyone when the provider reports exhausted quota."""
+        retry_after = _parse_seconds(headers.get("retry-after"))
+        if status_code == 429:
+            self.pause(retry_after if retry_after is not None else BACKOFF_BASE)
+            return
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and remaining.strip() == "0":
+            reset = _parse_seconds(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.pause(reset)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None  # a half-open probe is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def _probing(self):
+        # a probe that never reported back (e.g. cancelled) expires after reset_timeout
+        return (self._probe_started is not None
+                and time.monotonic() - self._probe_started < self.reset_timeout)
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._probing()):
+                raise CircuitOpenError("model endpoint circuit is open; failing fast")
+            if state == "half_open":
+                self._probe_started = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe_started is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probe_started = None
+
+
+limiter = TokenBucket()
+breaker = CircuitBreaker()
+
+
+def is_retryable(exc):
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    import openai
+    return isinstance(exc, openai.APIConnectionError)
+
+
+def _backoff(attempt, exc):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    if response is not None:
+        retry_after = _parse_seconds(response.headers.get("retry-after"))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+    return delay
+
+
+def call_with_retry(fn, stats=None):
+    """Run a blocking model call through the limiter, retries and breaker."""
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.before_call()
+        limiter.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:  # only provider-health failures count toward the breaker
+                breaker.record_failure()
+            if attempt == MAX_RETRIES or not retryable:
+                raise
+            if stats is not None:
+                stats["retries"] = stats.get("retries", 0) + 1
+            time.sleep(_backoff(attempt, e))
+            continue
+        breaker.record_success()
+        return result
+
+
+async def acall_with_retry(fn, stats=None):
+    """Async counterpart of call_with_retry; `fn` returns an awaitable."""
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.before_call()
+        await limiter.aacquire()
+        try:
+            result = await fn()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:  # only provider-health failures count toward the breaker
+                breaker.record_failure()
+            if attempt == MAX_RETRIES or not retryable:
+                raise
+            if stats is not None:
+                stats["retries"] = stats.get("retries", 0) + 1
+            await asyncio.sleep(_backoff(attempt, e))
+            continue
+        breaker.record_success()
+        return result
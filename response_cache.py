@@ -0,0 +1,374 @@
+# response_cache.py
+"""Content-addressed cache for agent model calls.
+
+Keys are a SHA-256 of the full request (model, messages, temperature and
+response_format when set), so
+identical prompts from any agent - or from new.py - share one entry.
+Two backends are available:
+  - MemoryCache: in-process LRU with TTL and a size cap
+  - SQLiteCache: on-disk cache that survives restarts (hits only note the
+    access time in memory; it is written in batches, on set or every few
+    seconds, so a hit costs one SELECT)
+Configure the process-wide cache with environment variables:
+  RESPONSE_CACHE=memory|sqlite|off      (default: memory)
+  RESPONSE_CACHE_PATH=response_cache.db (sqlite backend only)
+  RESPONSE_CACHE_TTL=86400              (seconds, 0 = never expire)
+  RESPONSE_CACHE_MAX_ENTRIES=10000
+  RESPONSE_CACHE_MAX_TEMPERATURE=       (skip caching above this temperature)
+  COALESCE_REQUESTS=1                   (share identical in-flight calls, see coalesce.py)
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from resilience import call_with_retry, acall_with_retry
+from coalesce import inflight, thread_inflight
+
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") != "0"
+
+
+def make_key(model, messages, temperature=None, response_format=None):
+    """Hash the full request into a stable cache key."""
+    request = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format is not None:
+        request["response_format"] = response_format
+    payload = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-memory LRU cache with optional TTL."""
+
+    def __init__(self, max_entries=10000, ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if self.ttl and time.time() - created > self.ttl:
+                del self._data[key]
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """On-disk cache backed by SQLite, evicting least-recently-used rows."""
+
+    blocking = True  # async callers run it in a thread (see ResponseCache.aget)
+
+    def __init__(self, path="response_cache.db", max_entries=10000, ttl=0,
+                 flush_interval=5.0, max_pending=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> access time not yet written
+        self._flushed = time.time()
+        # WAL + busy timeout: safe to share between uvicorn worker processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl and now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._touched.pop(key, None)
+                self.evictions += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.max_pending or now - self._flushed >= self.flush_interval:
+                self._flush()
+                self._conn.commit()
+            return value
+
+    def _flush(self):
+        """Write the pending access times (caller holds the lock and commits)."""
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+        self._flushed = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush()  # eviction below orders by access time
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._touched.clear()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Front-end over a cache backend that records hit/miss metrics."""
+
+    def __init__(self, backend, max_temperature=None):
+        self.backend = backend
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, temperature=None):
+        """Sampled (high-temperature) calls can be excluded from caching."""
+        if self.max_temperature is None or temperature is None:
+            return True
+        return temperature <= self.max_temperature
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if value is not None:
+            self.backend.set(key, value)
+
+    async def aget(self, key):
+        """get() for async callers; a blocking (SQLite) backend runs in a thread."""
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key, value):
+        if getattr(self.backend, "blocking", False):
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide ResponseCache (None when disabled)."""
+    global _cache
+    if _cache is None:
+        kind = os.getenv("RESPONSE_CACHE", "memory").lower()
+        if kind == "off":
+            return None
+        ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+        max_temperature = os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE")
+        if kind == "sqlite":
+            backend = SQLiteCache(os.getenv("RESPONSE_CACHE_PATH", "response_cache.db"),
+                                  max_entries=max_entries, ttl=ttl)
+        else:
+            backend = MemoryCache(max_entries=max_entries, ttl=ttl)
+        _cache = ResponseCache(backend, float(max_temperature) if max_temperature else None)
+    return _cache
+
+
+def _record_usage(stats, usage):
+    if stats is not None and usage is not None:
+        stats["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        stats["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+
+
+def _request_kwargs(temperature, response_format):
+    kwargs = {"temperature": temperature} if temperature is not None else {}
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+
+def _prepare(model, messages, temperature, response_format):
+    """Return (cache, key); key is None when the call must not be shared."""
+    cache = get_cache()
+    cacheable = cache is None or cache.cacheable(temperature)
+    key = make_key(model, messages, temperature, response_format) if cacheable else None
+    return (cache if cacheable else None), key
+
+
+def _lookup(model, messages, temperature, response_format, stats):
+    """Return (cache, key, hit)."""
+    cache, key = _prepare(model, messages, temperature, response_format)
+    hit = None
+    if cache is not None:
+        hit = cache.get(key)
+        if stats is not None:
+            stats["cached"] = hit is not None
+    return cache, key, hit
+
+
+async def _alookup(model, messages, temperature, response_format, stats):
+    """_lookup() that keeps a blocking cache backend off the event loop."""
+    cache, key = _prepare(model, messages, temperature, response_format)
+    hit = None
+    if cache is not None:
+        hit = await cache.aget(key)
+        if stats is not None:
+            stats["cached"] = hit is not None
+    return cache, key, hit
+
+
+def _finish(cache, key, content, usage, shared, stats):
+    if stats is not None:
+        if shared:
+            stats["coalesced"] = True
+        else:
+            _record_usage(stats, usage)
+    if cache is not None and not shared:
+        cache.set(key, content)
+    return content
+
+
+async def _afinish(cache, key, content, usage, shared, stats):
+    _finish(None, key, content, usage, shared, stats)
+    if cache is not None and not shared:
+        await cache.aset(key, content)
+    return content
+
+
+def cached_completion(client, model, messages, temperature=None, stats=None,
+                      response_format=None):
+    """Blocking chat completion that consults the shared cache first.
+    Identical concurrent calls share one upstream request.
+    If given, `stats` is filled with cache hit/miss and token usage."""
+    cache, key, hit = _lookup(model, messages, temperature, response_format, stats)
+    if hit is not None:
+        return hit
+    kwargs = _request_kwargs(temperature, response_format)
+
+    def fetch():
+        response = call_with_retry(
+            lambda: client.chat.completions.create(model=model, messages=messages, **kwargs), stats)
+        return response.choices[0].message.content, getattr(response, "usage", None)
+
+    if COALESCE_REQUESTS and key is not None:
+        (content, usage), shared = thread_inflight.do(key, fetch)
+    else:
+        (content, usage), shared = fetch(), False
+    return _finish(cache, key, content, usage, shared, stats)
+
+
+async def acached_completion(client, model, messages, temperature=None, stats=None,
+                             response_format=None):
+    """Async chat completion that consults the shared cache first.
+    Identical concurrent calls share one upstream request."""
+    cache, key, hit = await _alookup(model, messages, temperature, response_format, stats)
+    if hit is not None:
+        return hit
+    kwargs = _request_kwargs(temperature, response_format)
+
+    async def fetch():
+        response = await acall_with_retry(
+            lambda: client.chat.completions.create(model=model, messages=messages, **kwargs), stats)
+        return response.choices[0].message.content, getattr(response, "usage", None)
+
+    if COALESCE_REQUESTS and key is not None:
+        (content, usage), shared = await inflight.do(key, fetch)
+    else:
+        (content, usage), shared = await fetch(), False
+    return await _afinish(cache, key, content, usage, shared, stats)
+
+
+async def acached_stream(client, model, messages, temperature=None, stats=None,
+                         response_format=None):
+    """Stream tokens; a cache hit is replayed as a single chunk.
+    Streams are not coalesced: every caller gets its own token stream."""
+    cache, key, hit = await _alookup(model, messages, temperature, response_format, stats)
+    if hit is not None:
+        yield hit
+        return
+    kwargs = _request_kwargs(temperature, response_format)
+    # only opening the stream is retried; tokens already sent cannot be replayed
+    stream = await acall_with_retry(
+        lambda: client.chat.completions.create(model=model, messages=messages, stream=True,
+                                               stream_options={"include_usage": True}, **kwargs), stats)
+    parts = []
+    async for chunk in stream:
+        _record_usage(stats, getattr(chunk, "usage", None))
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield chunk.choices[0].delta.content
+    if cache is not None:
+        await cache.aset(key, "".join(parts))
@@ -0,0 +1,226 @@
+# sessions.py
+"""Per-run simulation sessions with turn-level checkpoints.
+
+Every backend run (/simulate, /jobs) is a Session keyed by its run ID and
+stored under SESSIONS_DIR/<run_id>/session.json through StateStore, so each
+completed agent turn is one fsync'ed journal append rather than a rewrite.
+Resuming a run replays the checkpointed turns - no model calls - and
+continues live from the first turn that was not completed, so a crash or
+restart mid-run only re-pays the turn that was in flight.
+
+Turns are keyed by (round, agent), which is unique in both the round-robin
+and the fan-out orchestration.
+
+Session directories are pruned by prune_sessions(): those untouched for
+SESSIONS_MAX_AGE seconds (default 7 days) and, beyond the newest
+SESSIONS_MAX_COUNT, the oldest ones (0 disables either limit).
+
+Read-only endpoints use Session.cached(), which keeps the last
+SESSION_CACHE_SIZE loaded sessions (and their history indexes) and reloads
+one only when its snapshot or journal changed on disk.
+
+The CLI agent scripts can be isolated the same way: with SIM_RUN_ID set,
+state_path() gives them SESSIONS_DIR/<run_id>/sim_state.json instead of the
+shared sim_state.json.
+"""
+import os
+import re
+import time
+import shutil
+import uuid
+import threading
+from collections import OrderedDict
+
+from state_store import StateStore
+from history_index import HistoryIndex
+
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "32"))
+SESSIONS_MAX_AGE = float(os.getenv("SESSIONS_MAX_AGE", str(7 * 24 * 3600)))
+SESSIONS_MAX_COUNT = int(os.getenv("SESSIONS_MAX_COUNT", "1000"))
+SESSIONS_PRUNE_INTERVAL = float(os.getenv("SESSIONS_PRUNE_INTERVAL", "3600"))
+_RUN_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_cache = OrderedDict()  # run_id -> (signature, Session), most recently used last
+_cache_lock = threading.Lock()
+
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+def valid_run_id(run_id):
+    return bool(run_id and _RUN_ID.match(run_id))
+
+
+def run_dir(run_id):
+    if not valid_run_id(run_id):
+        raise ValueError(f"Invalid run ID: {run_id!r}")
+    return os.path.join(SESSIONS_DIR, run_id)
+
+
+def state_path(run_id=None):
+    """sim_state.json for the CLI agents; per-run when run_id or SIM_RUN_ID is set."""
+    run_id = run_id or os.getenv("SIM_RUN_ID")
+    if not run_id:
+        return "sim_state.json"
+    os.makedirs(run_dir(run_id), exist_ok=True)
+    return os.path.join(run_dir(run_id), "sim_state.json")
+
+
+def _last_modified(path):
+    """Newest mtime of a run directory and its files (journal appends included)."""
+    latest = os.stat(path).st_mtime
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                latest = max(latest, entry.stat().st_mtime)
+            except FileNotFoundError:
+                pass  # replaced meanwhile (compaction)
+    return latest
+
+
+def prune_sessions(max_age=SESSIONS_MAX_AGE, max_count=SESSIONS_MAX_COUNT, keep=()):
+    """Delete expired run directories (see the module docstring), except the
+    run IDs in `keep`. Returns the number deleted."""
+    if not os.path.isdir(SESSIONS_DIR):
+        return 0
+    runs = []
+    for name in os.listdir(SESSIONS_DIR):
+        path = os.path.join(SESSIONS_DIR, name)
+        if valid_run_id(name) and name not in keep and os.path.isdir(path):
+            try:
+                runs.append((_last_modified(path), name))
+            except FileNotFoundError:
+                pass  # deleted meanwhile
+    runs.sort(reverse=True)  # newest first
+    cutoff = time.time() - max_age if max_age else None
+    expired = [name for i, (modified, name) in enumerate(runs)
+               if (max_count and i >= max_count) or (cutoff is not None and modified < cutoff)]
+    for name in expired:
+        with _cache_lock:
+            _cache.pop(name, None)
+        shutil.rmtree(os.path.join(SESSIONS_DIR, name), ignore_errors=True)
+    return len(expired)
+
+
+class Session:
+    def __init__(self, run_id, store, state):
+        self.run_id = run_id
+        self.store = store
+        self.state = state
+        self._turns = {(e["round"], e["agent"]): e for e in state.get("chat_history", [])}
+        self._history = None
+
+    @classmethod
+    def create(cls, params, run_id=None):
+        run_id = run_id or uuid.uuid4().hex
+        os.makedirs(run_dir(run_id), exist_ok=True)
+        store = StateStore(os.path.join(run_dir(run_id), "session.json"))
+        state = {"run_id": run_id, "params": params, "status": RUNNING, "done": False,
+                 "stop_reason": None, "created_at": time.time(), "updated_at": time.time(),
+                 "chat_history": []}
+        store.save(state)
+        return cls(run_id, store, state)
+
+    @classmethod
+    def load(cls, run_id):
+        """Load a session; None if it does not exist."""
+        if not valid_run_id(run_id):
+            return None
+        store = StateStore(os.path.join(run_dir(run_id), "session.json"))
+        if not store.exists():
+            return None
+        return cls(run_id, store, store.load())
+
+    @classmethod
+    def cached(cls, run_id):
+        """Load a session for reading, reusing the previous load (and history
+        index) while its files are unchanged; None if it does not exist.
+        Callers must not modify it."""
+        if not valid_run_id(run_id):
+            return None
+        store = StateStore(os.path.join(run_dir(run_id), "session.json"))
+        try:
+            signature = store.signature()
+        except FileNotFoundError:
+            with _cache_lock:
+                _cache.pop(run_id, None)
+            return None
+        with _cache_lock:
+            entry = _cache.get(run_id)
+            if entry is not None and entry[0] == signature:
+                _cache.move_to_end(run_id)
+                return entry[1]
+        session = cls(run_id, store, store.load())
+        with _cache_lock:
+            _cache[run_id] = (signature, session)
+            _cache.move_to_end(run_id)
+            while len(_cache) > SESSION_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return session
+
+    @classmethod
+    def open(cls, params, run_id):
+        """Load `run_id` if it was checkpointed before, otherwise start it."""
+        return cls.load(run_id) or cls.create(params, run_id)
+
+    @property
+    def params(self):
+        return self.state["params"]
+
+    def recorded(self, round_idx, agent):
+        """Checkpointed turn {"round", "agent", "tokens", "turn"} or None."""
+        return self._turns.get((round_idx, agent))
+
+    def checkpoint(self, round_idx, agent, turn, tokens=0):
+        """Persist one completed turn (a journal append)."""
+        entry = {"round": round_idx, "agent": agent, "tokens": tokens, "turn": turn}
+        replaced = (round_idx, agent) in self._turns
+        self._turns[(round_idx, agent)] = entry
+        self.store.append_message(self.state, entry)
+        if replaced:
+            self._history = None
+        elif self._history is not None:
+            self._history.append(entry)
+
+    def finish(self, done=False, stop_reason=None, error=None):
+        self.state.update(status=FAILED if error else FINISHED, done=done, stop_reason=stop_reason,
+                          error=error, updated_at=time.time())
+        self.store.save(self.state)
+
+    def resume_params(self, **overrides):
+        """Params for continuing the run, e.g. with a higher max_rounds."""
+        params = dict(self.params)
+        params.update((k, v) for k, v in overrides.items() if v is not None)
+        self.state.update(params=params, status=RUNNING, updated_at=time.time())
+        self.store.save(self.state)
+        return params
+
+    def summary(self):
+        return {
+            "run_id": self.run_id,
+            "status": self.state["status"],
+            "params": self.params,
+            "turns": len(self._turns),
+            "done": self.state["done"],
+            "stop_reason": self.state["stop_reason"],
+            "error": self.state.get("error"),
+            "created_at": self.state["created_at"],
+            "updated_at": self.state["updated_at"],
+        }
+
+    def conversation(self):
+        # a turn re-run after a resume replaces its earlier checkpoint
+        return [entry["turn"] for entry in self._turns.values()]
+
+    def history(self):
+        """Checkpoint entries indexed by authoring agent (see history_index.py)."""
+        if self._history is None:
+            self._history = HistoryIndex(self._turns.values(), sender_field="agent")
+        return self._history
+
+    def delete(self):
+        with _cache_lock:
+            _cache.pop(self.run_id, None)
+        shutil.rmtree(run_dir(self.run_id), ignore_errors=True)
@@ -0,0 +1,97 @@
+# shared_client.py
+"""Shared, lazily-built OpenAI clients used by every agent.
+
+The backend orchestrator awaits agent calls through one pooled async client,
+so a single uvicorn worker can keep hundreds of simulations in flight
+without pinning a threadpool worker per run; the CLI scripts share one sync
+client. Neither client (nor the openai/httpx import chain) is created until
+the first model call. Pool size and endpoint are configurable through
+environment variables, which also lets tests point at a local fake
+OpenAI-compatible server (set MODEL_BASE_URL=http://127.0.0.1:<port>/v1).
+
+Retries are handled by resilience.py (the SDK's own retries are disabled),
+and every response's rate-limit headers are fed to its shared limiter.
+
+Additional OpenAI-compatible endpoints (see model_backends.py) get their own
+pooled clients, keyed by base URL and API-key variable.
+"""
+import os
+import threading
+from resilience import limiter
+
+BASE_URL = os.getenv("MODEL_BASE_URL", "https://models.inference.ai.azure.com")
+MAX_CONNECTIONS = int(os.getenv("MODEL_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("MODEL_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("MODEL_KEEPALIVE_EXPIRY", "30"))
+REQUEST_TIMEOUT = float(os.getenv("MODEL_TIMEOUT", "120"))
+
+API_KEY_ENV = "YOUR_API_KEY_HERE"
+
+_clients = {}        # (base_url, api_key_env) -> OpenAI
+_async_clients = {}  # (base_url, api_key_env) -> AsyncOpenAI
+_lock = threading.Lock()  # the backend warms clients in a thread while requests may arrive
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _observe(response):
+    limiter.observe_headers(response.status_code, response.headers)
+
+
+async def _aobserve(response):
+    limiter.observe_headers(response.status_code, response.headers)
+
+
+def get_client(base_url=None, api_key_env=API_KEY_ENV):
+    """Return the process-wide blocking OpenAI client, creating it on first use."""
+    key = (base_url or BASE_URL, api_key_env)
+    client = _clients.get(key)
+    if client is None:
+        import httpx
+        from openai import OpenAI
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = OpenAI(
+                    api_key=os.getenv(api_key_env),
+                    base_url=key[0],
+                    max_retries=0,
+                    http_client=httpx.Client(limits=_limits(), timeout=REQUEST_TIMEOUT,
+                                             event_hooks={"response": [_observe]}),
+                )
+    return client
+
+
+def get_async_client(base_url=None, api_key_env=API_KEY_ENV):
+    """Return the process-wide AsyncOpenAI client, creating it on first use."""
+    key = (base_url or BASE_URL, api_key_env)
+    client = _async_clients.get(key)
+    if client is None:
+        import httpx
+        from openai import AsyncOpenAI
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = _async_clients[key] = AsyncOpenAI(
+                    api_key=os.getenv(api_key_env),
+                    base_url=key[0],
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=_limits(), timeout=REQUEST_TIMEOUT,
+                                                  event_hooks={"response": [_aobserve]}),
+                )
+    return client
+
+
+async def close_async_client():
+    """Close the pooled connections (called on backend shutdown)."""
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.close()
@@ -0,0 +1,122 @@
+# speculation.py
+"""Speculative prefetch of the next agent turn while the current one streams.
+
+In a round-robin run the next agent's prompt quotes the latest reply, but
+only its first latest_tokens() tokens (longer replies are cut, see
+context_manager.py). Once the streamed part of a reply is longer than that,
+the next prompt cannot change any more, so the next agent's call can start
+while the rest of the reply is still streaming. Its tokens are buffered
+and streamed out when its turn comes.
+
+A speculation is used only if the prompt built when its turn actually
+comes equals the one it was started with; otherwise (the reply failed, or
+the run stopped) it is cancelled and discarded. A speculative reply is
+written to the agent's short-term memory only once it is used, so
+mispredictions never show up in later recalls. Outcomes are counted in
+agent_speculations_total (hit rate = hit / started).
+
+Speculative runs (SPECULATE=1, or per request) quote at most
+SPECULATE_PREFIX_TOKENS tokens of the latest reply, so speculation starts
+that far into a reply (0: the full budget share, i.e. only very long replies).
+"""
+import os
+import asyncio
+
+from context_manager import build_prompt, latest_tokens
+from metrics import record_speculation
+
+SPECULATE = os.getenv("SPECULATE", "0") == "1"
+SPECULATE_PREFIX_TOKENS = int(os.getenv("SPECULATE_PREFIX_TOKENS", "400"))
+
+
+class Speculation:
+    """One call started ahead of its turn; tokens are buffered until it is claimed."""
+
+    def __init__(self, agent, prompt, stream):
+        self.agent = agent
+        self.prompt = prompt
+        self.stats = {}
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._pump(stream(prompt, self.stats)))
+
+    async def _pump(self, tokens):
+        try:
+            async for token in tokens:
+                self.queue.put_nowait(token)
+            self.queue.put_nowait(None)
+        except Exception as e:
+            self.queue.put_nowait(e)
+
+    async def tokens(self):
+        """Buffered tokens, then the rest as they arrive (re-raises the call's error)."""
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        if not self.task.done():
+            self.stats["cancelled"] = True
+            self.task.cancel()
+
+
+class Speculator:
+    """Starts at most one follower call per run ahead of time; see the module docstring."""
+
+    def __init__(self, prefix_tokens=SPECULATE_PREFIX_TOKENS):
+        self.cap = prefix_tokens or None
+        self.limit = latest_tokens(cap=self.cap) * 4  # characters of the latest line quoted
+        self.pending = None
+        self.counts = {"started": 0, "hit": 0, "miss": 0, "discarded": 0}
+
+    def _count(self, agent, result):
+        self.counts[result] += 1
+        record_speculation(agent, result)
+
+    def prompt(self, history, agent):
+        """Prompt for `agent`'s turn (quotes at most `cap` tokens of the latest reply)."""
+        return build_prompt(history, agent, cap=self.cap)
+
+    def watch(self, history, sender, follower, stream):
+        """
+        on_text(parts, size) hook for `sender`'s streaming reply: once the
+        reply is long enough that `follower`'s prompt is settled, start
+        stream(prompt, stats) for it.
+        """
+        prefix = len(sender) + 2  # "<sender>: " precedes the reply in the prompt
+
+        def on_text(parts, size):
+            if self.pending is None and prefix + size > self.limit:
+                prompt = self.prompt(list(history) + [{"from": sender, "response": "".join(parts)}], follower)
+                self.pending = Speculation(follower, prompt, stream)
+                self._count(follower, "started")
+        return on_text
+
+    def claim(self, agent, prompt):
+        """The pending speculation if it matches this turn, else None (and it is discarded)."""
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return None
+        if pending.agent == agent and pending.prompt == prompt:
+            self._count(agent, "hit")
+            return pending
+        pending.cancel()
+        self._count(pending.agent, "miss")
+        return None
+
+    def discard(self):
+        """Cancel a speculation the run ended without using."""
+        if self.pending is not None:
+            self.pending.cancel()
+            self._count(self.pending.agent, "discarded")
+            self.pending = None
+
+    def stats(self):
+        started = self.counts["started"]
+        return dict(self.counts, hit_rate=round(self.counts["hit"] / started, 3) if started else None)
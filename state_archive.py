@@ -0,0 +1,241 @@
+# state_archive.py
+"""Compact binary snapshots of the simulation state, read lazily.
+
+sim_state.json is pretty-printed and has to be parsed whole, which is slow
+and memory-heavy for archived runs with a long chat_history. An archive
+(.simstate) holds the same state as length-prefixed records plus an offset
+index, so it can be memory-mapped and a message read by its index without
+touching the others:
+
+    header   "SIMSTATE" u16 version, u16 flags, u32 message count,
+             u64 offsets of the index, the state record and the shapes record
+    records  u32 length + payload, one per chat_history message, then the
+             rest of the state and the shapes table
+    index    u64 offset of each message record
+
+Payloads are compact JSON (zlib-compressed per record unless written with
+compress=False, so random access still works). A message is stored as
+[shape, value, ...]: the shapes table lists each distinct sequence of keys
+once, which keeps key order and absent keys exact. Conversions to and from
+the JSON state (the initialize_state schema, journal included) are lossless.
+
+    python state_archive.py pack sim_state.json run.simstate
+    python state_archive.py unpack run.simstate sim_state.json
+    python state_archive.py show run.simstate 120 5    # messages 120-124 (-1: the last)
+    python state_archive.py diff a.simstate b.simstate
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import argparse
+
+MAGIC = b"SIMSTATE"
+VERSION = 1
+COMPRESSED = 1  # flags bit
+
+HEADER = struct.Struct("<8sHHIQQQ")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+HISTORY_KEY = "chat_history"
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+# --- Writing ---
+def write_archive(state, path, compress=True):
+    """Write `state` (a sim_state dict) as an archive at `path` (atomically)."""
+    history = state.get(HISTORY_KEY)
+    # the history's position among the keys is kept by a None placeholder
+    rest = {k: (None if k == HISTORY_KEY else v) for k, v in state.items()}
+    shapes = {}
+    offsets = []
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        def record(obj):
+            payload = _dumps(obj)
+            if compress:
+                payload = zlib.compress(payload)
+            offset = f.tell()
+            f.write(LENGTH.pack(len(payload)))
+            f.write(payload)
+            return offset
+
+        f.write(b"\0" * HEADER.size)
+        for message in history or ():
+            shape = shapes.setdefault(tuple(message), len(shapes))
+            offsets.append(record([shape, *message.values()]))
+        state_offset = record([rest, history is not None])
+        shapes_offset = record([list(keys) for keys in shapes])
+        index_offset = f.tell()
+        f.write(b"".join(OFFSET.pack(o) for o in offsets))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, COMPRESSED if compress else 0, len(offsets),
+                            index_offset, state_offset, shapes_offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# --- Reading ---
+class StateArchive:
+    """Memory-mapped archive; messages are decoded only when accessed."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a state archive")
+        magic, version, flags, self.count, self._index, state_offset, shapes_offset = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a state archive")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"{path}: unsupported archive version {version}")
+        self._compressed = bool(flags & COMPRESSED)
+        self._state_offset = state_offset
+        self._shapes = [tuple(keys) for keys in self._load(shapes_offset)]
+
+    def _stored(self, offset):
+        (length,) = LENGTH.unpack_from(self._map, offset)
+        return self._map[offset + LENGTH.size:offset + LENGTH.size + length]
+
+    def _payload(self, offset):
+        payload = self._stored(offset)
+        return zlib.decompress(payload) if self._compressed else payload
+
+    def _load(self, offset):
+        return json.loads(self._payload(offset))
+
+    def _offset(self, i):
+        return OFFSET.unpack_from(self._map, self._index + i * OFFSET.size)[0]
+
+    def raw(self, i, decompress=True):
+        """Encoded message `i` (equal bytes mean equal messages, see first_difference)."""
+        offset = self._offset(i)
+        return self._payload(offset) if decompress else self._stored(offset)
+
+    def message(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("message index out of range")
+        shape, *values = self._load(self._offset(i))
+        return dict(zip(self._shapes[shape], values))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.message(i) for i in range(*item.indices(self.count))]
+        return self.message(item)
+
+    def __iter__(self):
+        return (self.message(i) for i in range(self.count))
+
+    def head(self):
+        """The state without chat_history (agents, documents, meta, ...)."""
+        rest, _ = self._load(self._state_offset)
+        rest.pop(HISTORY_KEY, None)
+        return rest
+
+    def state(self):
+        """The full state, exactly as it was written."""
+        rest, has_history = self._load(self._state_offset)
+        if has_history:
+            rest[HISTORY_KEY] = list(self)
+        return rest
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def first_difference(a, b):
+    """Index of the first message that differs between two archives (or
+    where the shorter one ends); None if their histories are identical.
+    Compares encoded bytes, so equal prefixes are never decoded."""
+    same_encoding = a._compressed == b._compressed
+    for i in range(min(len(a), len(b))):
+        # compressed bytes can differ across zlib versions: confirm on the payloads
+        if (not same_encoding or a.raw(i, False) != b.raw(i, False)) and a.raw(i) != b.raw(i):
+            return i
+    return None if len(a) == len(b) else min(len(a), len(b))
+
+
+# --- JSON conversion ---
+def json_to_archive(json_path, archive_path, compress=True):
+    """Pack a sim_state.json (with any journaled entries, see state_store.py)."""
+    from state_store import StateStore
+    state = StateStore(json_path).load()
+    write_archive(state, archive_path, compress)
+    return len(state.get(HISTORY_KEY) or ())
+
+
+def archive_to_json(archive_path, json_path):
+    """Unpack an archive into a sim_state.json the agents can load."""
+    from state_store import StateStore
+    with StateArchive(archive_path) as archive:
+        state = archive.state()
+    StateStore(json_path).save(state)
+    return len(state.get(HISTORY_KEY) or ())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact binary snapshots of sim_state.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="sim_state.json -> archive")
+    pack.add_argument("json_path")
+    pack.add_argument("archive_path")
+    pack.add_argument("--no-compress", action="store_true")
+    unpack = commands.add_parser("unpack", help="archive -> sim_state.json")
+    unpack.add_argument("archive_path")
+    unpack.add_argument("json_path")
+    show = commands.add_parser("show", help="print messages by index")
+    show.add_argument("archive_path")
+    show.add_argument("start", type=int, nargs="?", default=0)
+    show.add_argument("count", type=int, nargs="?", default=1)
+    diff = commands.add_parser("diff", help="first differing message of two archives")
+    diff.add_argument("a")
+    diff.add_argument("b")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "pack":
+            count = json_to_archive(args.json_path, args.archive_path, compress=not args.no_compress)
+            print(f"✅ Packed {count} message(s): {os.path.getsize(args.archive_path)} bytes")
+        elif args.command == "unpack":
+            count = archive_to_json(args.archive_path, args.json_path)
+            print(f"✅ Unpacked {count} message(s) to {args.json_path}")
+        elif args.command == "show":
+            with StateArchive(args.archive_path) as archive:
+                # a negative start counts from the end, like message(-1)
+                start = args.start + len(archive) if args.start < 0 else args.start
+                if not 0 <= start < len(archive):
+                    raise ValueError(f"start {args.start} is out of range ({len(archive)} messages)")
+                print(json.dumps(archive[start:start + args.count], indent=2, ensure_ascii=False))
+        else:
+            with StateArchive(args.a) as a, StateArchive(args.b) as b:
+                i = first_difference(a, b)
+                if i is None:
+                    print(f"✅ Identical histories ({len(a)} messages)")
+                else:
+                    print(f"⚠️ Histories differ from message {i} ({len(a)} vs {len(b)} messages)")
+                    print(json.dumps({"a": a[i:i + 1], "b": b[i:i + 1]}, indent=2, ensure_ascii=False))
+    except (OSError, ValueError) as e:
+        sys.exit(f"❌ {e}")
@@ -0,0 +1,188 @@
+# state_store.py
+"""Append-only store for the simulation state (sim_state.json).
+
+Instead of re-serializing the whole state on every step, chat_history
+entries are appended as one compact JSON line to a journal file next to the
+snapshot. Every `compact_every` appends the journal is folded back into the
+snapshot. All writes hold an exclusive file lock, and snapshots are written
+to a temp file and atomically renamed into place. Other changes (e.g. an
+agent adding itself) go through update(), which holds the lock from load
+to save so concurrent appends are not lost.
+
+The snapshot records which journal generation belongs to it (top-level
+"_journal" key, stripped on load), so a crash during compaction never
+replays entries twice: the new snapshot points at a fresh journal and the
+old one is simply left behind and deleted.
+"""
+import os
+import re
+import json
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no inter-process locking
+    fcntl = None
+
+JOURNAL_KEY = "_journal"
+_GENERATION_RE = re.compile(r'^\{\s*"_journal":\s*(\d+)')
+
+
+class StateStore:
+    def __init__(self, path="sim_state.json", compact_every=50):
+        self.path = path
+        self.compact_every = compact_every
+        self._pending = None  # journal entries since the last compaction
+
+    # --- locking / file helpers ---
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _journal_path(self, generation):
+        return f"{self.path}.journal.{generation}"
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"{self.path} not found. Run CEO agent first.")
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        return state, state.pop(JOURNAL_KEY, 0)
+
+    def _read_generation(self):
+        """Journal generation from the snapshot header, without parsing the body."""
+        with open(self.path, "r") as f:
+            head = f.read(64)
+        match = _GENERATION_RE.match(head)
+        return int(match.group(1)) if match else self._read_snapshot()[1]
+
+    def _read_journal(self, generation):
+        entries = []
+        journal = self._journal_path(generation)
+        if os.path.exists(journal):
+            with open(journal, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            entries.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            continue  # torn line from a crash (see append_message)
+        return entries
+
+    def _write_snapshot(self, state, generation):
+        # generation goes first so _read_generation only needs the header
+        data = {JOURNAL_KEY: generation}
+        data.update((k, v) for k, v in state.items() if k != JOURNAL_KEY)
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _load_unlocked(self):
+        state, generation = self._read_snapshot()
+        entries = self._read_journal(generation)
+        state.setdefault("chat_history", []).extend(entries)
+        self._pending = len(entries)
+        return state, generation
+
+    # --- public API ---
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def signature(self):
+        """Changes whenever the snapshot or its journal does (to cache loads)."""
+        snapshot = os.stat(self.path)
+        generation = self._read_generation()
+        try:
+            journal = os.stat(self._journal_path(generation))
+            journal = (journal.st_mtime_ns, journal.st_size)
+        except FileNotFoundError:
+            journal = None
+        return snapshot.st_ino, snapshot.st_mtime_ns, snapshot.st_size, generation, journal
+
+    def load(self):
+        """Return the full state: snapshot plus any journaled chat entries."""
+        with self._locked():
+            state, _ = self._load_unlocked()
+        return state
+
+    def save(self, state):
+        """Replace the whole state (used when agents or documents change)."""
+        with self._locked():
+            generation = self._read_generation() + 1 if self.exists() else 0
+            self._write_snapshot(state, generation)
+            self._remove_journal(generation - 1)
+            self._pending = 0
+
+    def update(self, fn):
+        """Locked read-modify-write: fn(state) edits the current state (journal
+        included) in place and it is saved before the lock is released, so
+        entries other processes append meanwhile are never overwritten.
+        Returns the saved state."""
+        with self._locked():
+            state, generation = self._load_unlocked()
+            fn(state)
+            self._write_snapshot(state, generation + 1)
+            self._remove_journal(generation)
+            self._pending = 0
+        return state
+
+    def append_message(self, state, message):
+        """Append one chat_history entry in memory and to the on-disk journal."""
+        state.setdefault("chat_history", []).append(message)
+        with self._locked():
+            if not self.exists():
+                self._write_snapshot(state, 0)
+                self._pending = 0
+                return
+            generation = self._read_generation()
+            with open(self._journal_path(generation), "a+b") as f:
+                self._cut_torn_tail(f)
+                f.write((json.dumps(message, separators=(",", ":")) + "\n").encode())
+                f.flush()
+                os.fsync(f.fileno())
+            if self._pending is None:
+                self._pending = len(self._read_journal(generation))
+            else:
+                self._pending += 1
+            if self._pending >= self.compact_every:
+                self._compact_unlocked()
+
+    @staticmethod
+    def _cut_torn_tail(f):
+        """Truncate a final line left without its newline by a crash, so the
+        next entry starts on a line of its own."""
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        f.truncate(f.read().rfind(b"\n") + 1)
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot."""
+        with self._locked():
+            self._compact_unlocked()
+
+    def _compact_unlocked(self):
+        # re-read from disk so entries appended by other processes are kept
+        state, generation = self._load_unlocked()
+        self._write_snapshot(state, generation + 1)
+        self._remove_journal(generation)
+        self._pending = 0
+
+    def _remove_journal(self, generation):
+        if generation >= 0 and os.path.exists(self._journal_path(generation)):
+            os.remove(self._journal_path(generation))
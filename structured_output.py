@@ -0,0 +1,155 @@
+# structured_output.py
+"""Structured (JSON) agent replies: extraction, validation and JSON mode.
+
+Agents are asked to answer in JSON, but models wrap it in code fences or
+prose, stream it token by token, or drop keys. This module replaces the
+per-agent index("{")/rindex("}") scanning and bare json.loads calls:
+  - JSONExtractor scans a token stream incrementally and parses the first
+    complete top-level object exactly once, as soon as its closing brace
+    arrives (fences and surrounding prose are skipped)
+  - SCHEMAS lists the expected keys per agent; validate() fills in missing
+    keys and coerces near-misses (a string where a list was expected)
+  - parse_reply() combines both and falls back to wrapping the raw text
+  - JSON mode (response_format={"type": "json_object"}) is requested when
+    MODEL_JSON_MODE=1 (default) and switched off for the rest of the
+    process if the provider rejects it
+"""
+import os
+import re
+import json
+
+JSON_MODE = os.getenv("MODEL_JSON_MODE", "1") != "0"
+
+# expected reply keys per agent: key -> "string" | "list"
+SCHEMAS = {
+    "CEO": {"decision": "string", "messages": "list", "artifacts": "list"},
+    "CTO": {"architecture": "string", "tools": "list", "timeline": "string"},
+    "Designer": {"layout": "string", "colors": "list", "typography": "string", "notes": "string"},
+    "Marketer": {"campaigns": "list", "social_post": "string", "growth_strategies": "list"},
+}
+
+# where unparseable raw text goes in the fallback reply
+FALLBACK_KEYS = {"CEO": "decision", "CTO": "architecture", "Designer": "notes", "Marketer": "social_post"}
+
+_SPECIAL = re.compile(r'[{}\[\]"\\]')
+_json_mode = JSON_MODE
+
+
+class JSONExtractor:
+    """Find and parse the first complete top-level JSON object in a token stream.
+
+    feed() only looks at the new chunk, so the work is linear in the reply
+    length however it is split; the object is parsed once when it closes.
+    """
+
+    def __init__(self):
+        self.result = None
+        self._offset = 0      # absolute position of the current chunk
+        self._depth = 0
+        self._in_string = False
+        self._skip = -1       # absolute position of an escaped character
+        self._parts = []
+
+    def feed(self, chunk):
+        """Consume `chunk`; returns the parsed object once it is complete, else None."""
+        if self.result is not None:
+            return self.result
+        start = 0 if self._depth else -1
+        for match in _SPECIAL.finditer(chunk):
+            pos = match.start()
+            ch = match.group()
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth, self._parts, start = 1, [], pos
+                continue
+            if self._in_string:
+                if self._offset + pos == self._skip:
+                    continue
+                if ch == "\\":
+                    self._skip = self._offset + pos + 1
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    text = "".join(self._parts) + chunk[start:pos + 1]
+                    self._parts = []
+                    try:
+                        value = json.loads(text)
+                    except ValueError:
+                        continue  # not JSON after all; keep looking for the next "{"
+                    if isinstance(value, dict):
+                        self.result = value
+                        return value
+        if self._depth:
+            self._parts.append(chunk[start:])
+        self._offset += len(chunk)
+        return None
+
+
+def extract_json(text):
+    """First JSON object embedded in `text` (fenced or not), or None."""
+    return JSONExtractor().feed(text)
+
+
+def validate(data, schema):
+    """Coerce `data` to `schema`; returns (data, problems). Extra keys are kept."""
+    data = dict(data)
+    problems = []
+    for key, kind in schema.items():
+        value = data.get(key)
+        if value is None:
+            data[key] = [] if kind == "list" else ""
+            problems.append(f"missing {key}")
+        elif kind == "list" and not isinstance(value, list):
+            data[key] = [value] if value != "" else []
+            problems.append(f"{key} is not a list")
+        elif kind == "string" and isinstance(value, (int, float, bool)):
+            data[key] = str(value)
+        # nested objects/lists where a string is expected are kept as-is
+    return data, problems
+
+
+def fallback_reply(agent_id, text):
+    """Schema-shaped reply wrapping unparseable raw text."""
+    schema = SCHEMAS.get(agent_id, {})
+    data, _ = validate({}, schema)
+    data[FALLBACK_KEYS.get(agent_id, "text")] = text.strip()
+    return data
+
+
+def parse_reply(agent_id, text, schema=None):
+    """Parse an agent's reply; returns (data, ok) where ok is False for the fallback."""
+    schema = SCHEMAS.get(agent_id, {}) if schema is None else schema
+    data = extract_json(text or "")
+    if data is None:
+        return fallback_reply(agent_id, text or ""), False
+    return validate(data, schema)[0], True
+
+
+def format_instruction(schema):
+    """User-turn suffix asking for a JSON reply with the schema's keys and a
+    status field ("DONE" ends the run, see convergence.py)."""
+    keys = ", ".join(f"{key} ({kind})" for key, kind in schema.items())
+    head = f"Respond ONLY in valid JSON with keys: {keys}." if keys else "Respond ONLY in valid JSON."
+    return head + ' Include "status": "DONE" once the plan is complete, otherwise "CONTINUE".'
+
+
+def json_response_format():
+    """response_format for JSON mode, or None when disabled/unsupported."""
+    return {"type": "json_object"} if _json_mode else None
+
+
+def json_mode_rejected(exc):
+    """True (and JSON mode switched off) if `exc` is the provider refusing response_format."""
+    global _json_mode
+    if getattr(exc, "status_code", None) == 400 and "response_format" in str(exc):
+        _json_mode = False
+        print("⚠️ Provider rejected JSON mode; continuing without response_format.")
+        return True
+    return False
+
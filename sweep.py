@@ -0,0 +1,255 @@
+# sweep.py
+"""Scenario sweeps: run many simulations (niches / prompts) in parallel.
+
+    python sweep.py scenarios.jsonl --out results.jsonl --workers 4 --concurrency 8
+
+The scenarios file is JSONL (or a JSON list, or CSV with a header) of
+objects with a "niche" and/or "prompt" and optionally "id", "max_rounds",
+"mode", "structured", "token_budget", "time_budget" and "workflow"; a
+plain text file is one niche per line. Missing fields come from the
+command line.
+
+Scenarios run in --workers processes, each running up to --concurrency
+simulations at once on its event loop (agent calls are I/O bound), and
+each result is appended to the output JSONL as soon as its run finishes.
+Re-running the same command resumes the sweep: scenarios already in the
+output without an error are skipped, and an interrupted scenario continues
+from its last checkpointed turn, as every scenario is a session whose run
+ID is derived from its params (see sessions.py).
+
+Worker processes share nothing in memory: with several workers the
+response cache defaults to SQLite (RESPONSE_CACHE_PATH), and MODEL_RPS
+applies per worker.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from collections import Counter
+
+DEFAULT_PROMPT = "We need to build a startup in this niche: {niche}."
+SCENARIO_FIELDS = ("niche", "prompt", "max_rounds", "mode", "structured", "token_budget", "time_budget",
+                   "workflow")
+
+
+# --- Step 1: Load scenarios ---
+def scenario_run_id(params):
+    """Stable session ID for a scenario's params (identical scenarios share it)."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"sweep-{digest[:20]}"
+
+
+def make_scenario(item, defaults):
+    """Scenario {"id", "run_id", "params"} from one input row."""
+    if isinstance(item, str):
+        item = {"niche": item}
+    params = dict(defaults)
+    params.update((k, item[k]) for k in SCENARIO_FIELDS if item.get(k) not in (None, ""))
+    if not params.get("prompt"):
+        if not params.get("niche"):
+            raise ValueError(f"Scenario needs a niche or a prompt: {item}")
+        params["prompt"] = DEFAULT_PROMPT.format(niche=params["niche"])
+    params["max_rounds"] = max(1, int(params["max_rounds"]))
+    params["structured"] = str(params.get("structured")).lower() in ("1", "true", "yes")
+    params["token_budget"] = int(params.get("token_budget") or 0)
+    params["time_budget"] = float(params.get("time_budget") or 0)
+    run_id = scenario_run_id(params)
+    return {"id": str(item.get("id") or run_id), "run_id": run_id, "params": params}
+
+
+def load_scenarios(path, defaults):
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.endswith(".json"):
+            rows = json.load(f)
+        elif path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    scenarios = [make_scenario(row, defaults) for row in rows]
+    ids = Counter(s["id"] for s in scenarios)
+    duplicates = [i for i, n in ids.items() if n > 1]
+    if duplicates:
+        raise ValueError(f"Duplicate scenario IDs: {duplicates[:5]}")
+    return scenarios
+
+
+def completed_ids(out_path):
+    """IDs of scenarios that already have an error-free result in `out_path`."""
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path, "r") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted sweep
+                if not result.get("error"):
+                    done.add(result["id"])
+    return done
+
+
+# --- Step 2: Run scenarios (inside worker processes) ---
+async def run_scenario(scenario, checkpoint=True, full=False):
+    from orchestrator import run_params
+    from sessions import Session
+    params = scenario["params"]
+    conversation = []
+    timings = []
+    start = time.perf_counter()
+    result = {"id": scenario["id"], "run_id": scenario["run_id"], "niche": params.get("niche"),
+              "prompt": params["prompt"], "max_rounds": params["max_rounds"], "mode": params["mode"]}
+    try:
+        session = Session.open(params, scenario["run_id"]) if checkpoint else None
+        done, reason = await run_params(params, conversation, timings, session)
+        result.update(done=done, stop_reason=reason, error=None)
+    except Exception as e:
+        result.update(done=False, stop_reason=None, error=f"{type(e).__name__}: {e}")
+    result.update(
+        turns=len(conversation),
+        replayed=len(conversation) - len(timings),
+        tokens=sum(t["tokens"] for t in timings),
+        seconds=round(time.perf_counter() - start, 3),
+        final=conversation[-1].get("data", conversation[-1]["response"]) if conversation else None,
+    )
+    if full:
+        result["conversation"] = conversation
+    return result
+
+
+async def consume(tasks, results, concurrency, checkpoint, full):
+    """Run scenarios from `tasks` (None ends a slot) with `concurrency` slots."""
+    from shared_client import close_async_client
+    loop = asyncio.get_running_loop()
+
+    async def slot():
+        while True:
+            scenario = await loop.run_in_executor(None, tasks.get)
+            if scenario is None:
+                return
+            results.put(await run_scenario(scenario, checkpoint, full))
+
+    try:
+        await asyncio.gather(*(slot() for _ in range(concurrency)))
+    finally:
+        await close_async_client()
+
+
+def worker(tasks, results, concurrency, checkpoint, full):
+    asyncio.run(consume(tasks, results, concurrency, checkpoint, full))
+
+
+# --- Step 3: Fan out, stream results, aggregate ---
+def run_sweep(scenarios, out_path, workers=1, concurrency=8, checkpoint=True, resume=True, full=False):
+    """Run `scenarios`, appending one JSON line per finished scenario to
+    `out_path`; returns the results of this invocation."""
+    done = completed_ids(out_path) if resume else set()
+    pending = [s for s in scenarios if s["id"] not in done]
+    print(f"🚀 {len(pending)} scenario(s) to run, {len(scenarios) - len(pending)} already done.")
+    if not pending:
+        return []
+    workers = max(1, min(workers, len(pending)))
+    concurrency = max(1, min(concurrency, -(-len(pending) // workers)))
+    if workers > 1:
+        os.environ.setdefault("RESPONSE_CACHE", "sqlite")
+
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for scenario in pending:
+        tasks.put(scenario)
+    for _ in range(workers * concurrency):
+        tasks.put(None)
+    processes = [multiprocessing.Process(target=worker, args=(tasks, results, concurrency, checkpoint, full),
+                                         daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    finished = []
+    with open(out_path, "a" if resume else "w") as out:
+        while len(finished) < len(pending):
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    print("⚠️ All workers exited before the sweep finished.")
+                    break
+                continue
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            finished.append(result)
+            mark = "❌" if result["error"] else "✅"
+            print(f"{mark} [{len(finished)}/{len(pending)}] {result['id']}: "
+                  f"{result['error'] or result['stop_reason']} in {result['seconds']}s")
+    for process in processes:
+        process.join(timeout=5)
+    return finished
+
+
+def summarize(results):
+    """Aggregate stats over sweep results."""
+    ok = [r for r in results if not r.get("error")]
+    seconds = sorted(r["seconds"] for r in ok)
+    return {
+        "scenarios": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "stop_reasons": dict(Counter(r["stop_reason"] for r in ok)),
+        "turns": sum(r["turns"] for r in ok),
+        "tokens": sum(r["tokens"] for r in ok),
+        "p50_seconds": seconds[len(seconds) // 2] if seconds else 0,
+        "max_seconds": seconds[-1] if seconds else 0,
+    }
+
+
+def read_results(out_path):
+    """Latest result per scenario ID from a sweep's output file."""
+    latest = {}
+    with open(out_path, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            latest[result["id"]] = result
+    return list(latest.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a sweep of startup simulations")
+    parser.add_argument("scenarios", help="JSONL / JSON / CSV file of scenarios, or a text file of niches")
+    parser.add_argument("--out", default="sweep_results.jsonl")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SWEEP_WORKERS", min(4, os.cpu_count() or 1))))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("SWEEP_CONCURRENCY", "8")),
+                        help="simulations running at once per worker process")
+    parser.add_argument("--rounds", type=int, default=3, help="default max_rounds")
+    parser.add_argument("--mode", default="round_robin", choices=["round_robin", "fanout", "dag"])
+    parser.add_argument("--structured", action="store_true")
+    parser.add_argument("--token-budget", type=int, default=0)
+    parser.add_argument("--time-budget", type=float, default=0)
+    parser.add_argument("--restart", action="store_true", help="overwrite --out instead of resuming")
+    parser.add_argument("--no-checkpoint", action="store_true", help="do not keep per-scenario sessions")
+    parser.add_argument("--full", action="store_true", help="include each conversation in the output")
+    args = parser.parse_args()
+
+    defaults = {"niche": None, "prompt": None, "max_rounds": args.rounds, "mode": args.mode,
+                "structured": args.structured, "token_budget": args.token_budget,
+                "time_budget": args.time_budget}
+    try:
+        scenarios = load_scenarios(args.scenarios, defaults)
+    except (OSError, ValueError) as e:
+        sys.exit(f"❌ {e}")
+    start = time.perf_counter()
+    run_sweep(scenarios, args.out, args.workers, args.concurrency, checkpoint=not args.no_checkpoint,
+              resume=not args.restart, full=args.full)
+    ids = {s["id"] for s in scenarios}
+    summary = summarize([r for r in read_results(args.out) if r["id"] in ids])
+    summary["elapsed_seconds"] = round(time.perf_counter() - start, 1)
+    print(f"\n📊 Sweep summary ({args.out}):")
+    print(json.dumps(summary, indent=2))
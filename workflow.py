@@ -0,0 +1,136 @@
+# workflow.py
+"""Dependency-graph (DAG) turn scheduling.
+
+The round-robin chain CEO -> CTO -> Designer -> Marketer runs every turn
+after the previous one, although e.g. the Marketer only needs the CEO's
+message. A workflow instead lists, for one round, each agent turn and the
+agents whose output it takes as input:
+
+    [{"agent": "CTO", "inputs": ["CEO"]},
+     {"agent": "Designer", "inputs": ["CEO", "CTO"]},
+     {"agent": "Marketer", "inputs": ["CEO"], "timeout": 60},
+     {"agent": "CEO", "inputs": ["CTO", "Designer", "Marketer"]}]
+
+An input names the latest turn of that agent: earlier in the same round if
+the agent is listed before, otherwise in the previous round (round 0 is the
+CEO kickoff). unroll() turns max_rounds of this into nodes, and execute()
+starts every node as soon as its inputs are done, so independent turns run
+concurrently and a round takes its critical path (here CEO -> CTO ->
+Designer -> CEO) rather than the sum of all turns. Each node runs once; its
+output is kept and handed to every node that depends on it. Per-node
+"timeout" defaults to DAG_NODE_TIMEOUT seconds.
+
+WORKFLOW_PATH points at a JSON file with the default workflow.
+"""
+import os
+import json
+import asyncio
+
+DAG_NODE_TIMEOUT = float(os.getenv("DAG_NODE_TIMEOUT", "120"))
+WORKFLOW_PATH = os.getenv("WORKFLOW_PATH")
+
+KICKOFF_AGENT = "CEO"
+
+DEFAULT_WORKFLOW = [
+    {"agent": "CTO", "inputs": ["CEO"]},
+    {"agent": "Designer", "inputs": ["CEO", "CTO"]},
+    {"agent": "Marketer", "inputs": ["CEO"]},
+    {"agent": "CEO", "inputs": ["CTO", "Designer", "Marketer"]},
+]
+
+
+class Node:
+    """One agent turn: runs after all `inputs` (node IDs) are done."""
+
+    __slots__ = ("id", "agent", "round", "inputs", "ancestors", "timeout", "position")
+
+    def __init__(self, agent, round_idx, inputs=(), timeout=None, position=0):
+        self.id = f"{agent}@{round_idx}"
+        self.agent = agent
+        self.round = round_idx
+        self.inputs = tuple(inputs)
+        self.ancestors = ()  # every node this one transitively depends on, in run order
+        self.timeout = timeout
+        self.position = position
+
+    def __repr__(self):
+        return f"Node({self.id!r}, inputs={list(self.inputs)!r})"
+
+
+def load_workflow(workflow=None):
+    """`workflow` (a list of steps or the path of a JSON file with one), else
+    the WORKFLOW_PATH file, else DEFAULT_WORKFLOW."""
+    workflow = workflow or WORKFLOW_PATH
+    if isinstance(workflow, str):
+        with open(workflow, "r") as f:
+            return json.load(f)
+    return workflow or DEFAULT_WORKFLOW
+
+
+def unroll(workflow, max_rounds, timeout=DAG_NODE_TIMEOUT):
+    """Nodes for a kickoff plus `max_rounds` rounds of `workflow`, in a
+    topological order. Raises ValueError for an invalid workflow."""
+    agents = [step["agent"] for step in workflow]
+    if len(set(agents)) != len(agents):
+        raise ValueError("Each agent may appear only once per workflow round")
+    nodes = [Node(KICKOFF_AGENT, 0, timeout=timeout)]
+    latest = {KICKOFF_AGENT: nodes[0]}
+    by_id = {nodes[0].id: nodes[0]}
+    for round_idx in range(1, max_rounds + 1):
+        previous = dict(latest)
+        for step in workflow:
+            inputs = []
+            for name in step.get("inputs", ()):
+                source = latest.get(name) if name in agents[:agents.index(step["agent"])] else previous.get(name)
+                if source is None:
+                    raise ValueError(f"Unknown input {name!r} for {step['agent']} (no earlier turn by {name})")
+                inputs.append(source.id)
+            node = Node(step["agent"], round_idx, inputs, step.get("timeout", timeout), len(nodes))
+            ancestors = set(inputs)
+            for source in inputs:
+                ancestors.update(by_id[source].ancestors)
+            node.ancestors = tuple(sorted(ancestors, key=lambda i: by_id[i].position))
+            nodes.append(node)
+            by_id[node.id] = node
+            latest[step["agent"]] = node
+    return nodes
+
+
+def critical_path(nodes):
+    """Number of turns on the longest dependency chain (the latency floor in turns)."""
+    depth = {}
+    for node in nodes:
+        depth[node.id] = 1 + max((depth[i] for i in node.inputs), default=0)
+    return max(depth.values(), default=0)
+
+
+async def execute(nodes, run_node, on_done=None):
+    """
+    Run `nodes` in dependency order, each as soon as its inputs are done.
+    run_node(node) is awaited once per node; on_done(node, result) is called
+    as nodes finish (in node order when several finish together) and may
+    return a truthy stop reason, which cancels the nodes still running.
+    Returns True if stopped early.
+    """
+    waiting = list(nodes)
+    done = set()
+    running = {}
+    try:
+        while waiting or running:
+            for node in [n for n in waiting if done.issuperset(n.inputs)]:
+                waiting.remove(node)
+                running[asyncio.ensure_future(run_node(node))] = node
+            if not running:
+                raise ValueError(f"Unsatisfiable inputs: {waiting[:3]}")
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(finished, key=lambda t: running[t].position):
+                node = running.pop(task)
+                done.add(node.id)
+                if on_done is not None and on_done(node, task.result()):
+                    return True
+        return False
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)